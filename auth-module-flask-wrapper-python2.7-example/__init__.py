@@ -1,11 +1,35 @@
 # coding: utf-8
 
+import importlib
+import threading
+
+
+def import_string(path):
+    """
+    Import an object by its path, such as 'package.module.Class' or 'package.module:Class'.
+    """
+    if ':' in path:
+        module_name, name = path.split(':', 1)
+    else:
+        module_name, _, name = path.rpartition('.')
+
+    obj = importlib.import_module(module_name)
+    for attr in name.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
 
 class StrategyRegistry(object):
     """
     A container for different strategies
+
+    Strategies can be registered lazily by a dotted path or an entry point. Their modules are imported
+    and the strategies are created with strategy_factory when they're found for the first time.
+    Without a strategy_factory, a strategy class is created with the data source as both its
+    user loader and data source, like the views do.
     """
     data_source = None
+    strategy_factory = None  # a callable which creates a strategy from a strategy class
 
     def __init__(self, data_source):
         """
@@ -13,7 +37,9 @@ class StrategyRegistry(object):
         :param sfkit.auth.interfaces.IStrategyRegistryDataSource data_source: a data source instance
         """
         self.available_strategies = {}
+        self.lazy_strategies = {}
         self.data_source = data_source
+        self._lock = threading.Lock()
 
     def add(self, strategy):
         """
@@ -22,6 +48,26 @@ class StrategyRegistry(object):
         """
         self.available_strategies[strategy.name] = strategy
 
+    def add_lazy(self, name, path):
+        """
+        Add a strategy class by its dotted path, it's imported on the first find
+        :param name: a strategy name
+        :param path: a path such as 'package.module:Class'
+        """
+        self.lazy_strategies[name] = path
+
+    def add_entry_points(self, group):
+        """
+        Add strategy classes of an entry point group lazily, only the entry point names are read here.
+        For example, in setup.py:
+            entry_points={'sfkit.auth.authorization_strategies': ['google = package.module:GoogleStrategy']}
+        :param group: an entry point group name
+        """
+        import pkg_resources
+
+        for entry_point in pkg_resources.iter_entry_points(group):
+            self.lazy_strategies[entry_point.name] = entry_point
+
     def delete(self, strategy):
         """
         Delete a strategy from the container
@@ -30,6 +76,8 @@ class StrategyRegistry(object):
         if strategy.name in self.available_strategies:
             del self.available_strategies[strategy.name]
 
+        self.lazy_strategies.pop(strategy.name, None)
+
     def find(self):
         """
         Find a strategy by its name. The name is taken from a data source.
@@ -41,3 +89,27 @@ class StrategyRegistry(object):
         if selected_type in self.available_strategies:
             return self.available_strategies[selected_type]
 
+        if selected_type in self.lazy_strategies:
+            return self._load(selected_type)
+
+    def _load(self, name):
+        with self._lock:
+            # another thread could have loaded it while we were waiting for the lock
+            if name in self.available_strategies:
+                return self.available_strategies[name]
+
+            target = self.lazy_strategies[name]
+            strategy_class = target.load() if hasattr(target, 'load') else import_string(target)
+            strategy = self._create(strategy_class)
+
+            self.available_strategies[name] = strategy
+            del self.lazy_strategies[name]
+
+        return strategy
+
+    def _create(self, strategy_class):
+        if self.strategy_factory is not None:
+            return self.strategy_factory(strategy_class)
+
+        return strategy_class(self.data_source, self.data_source)
+
@@ -0,0 +1,102 @@
+# coding: utf-8
+
+import threading
+import time
+from collections import OrderedDict
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class ITokenBucketStore(object):
+    """
+    Keeps token buckets. Implement it with a shared store to limit several workers together.
+    """
+
+    def consume(self, key, cost, rate, capacity):
+        """
+        Take cost tokens from a bucket if it has enough of them.
+        :param key: a bucket key
+        :param cost: how many tokens to take
+        :param rate: how many tokens are added to the bucket per second
+        :param capacity: the maximum number of tokens in the bucket, a new bucket is full
+        :return: True if the tokens have been taken
+        """
+        raise NotImplementedError()
+
+
+class MemoryTokenBucketStore(ITokenBucketStore):
+    """
+    Token buckets in the process memory. The least recently used buckets are dropped when there are
+    too many of them, a dropped bucket is full again.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, cost, rate, capacity):
+        now = _clock()
+
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+            admitted = tokens >= cost
+            if admitted:
+                tokens -= cost
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return admitted
+
+
+class AdmissionController(object):
+    """
+    Limits expensive sign in work, such as password verifications and facebook calls, per login and
+    per client with token buckets. An attempt is rejected before any work is done when one of its
+    buckets is empty.
+    """
+    default_costs = {
+        'simple': 1,
+        'facebook': 1,
+    }
+
+    def __init__(self, store=None, login_rate=5 / 60.0, login_capacity=10, client_rate=1, client_capacity=30,
+                 costs=None):
+        """
+        Constructor.
+        :param ITokenBucketStore store: a store of buckets, they're kept in memory by default
+        :param login_rate: how many attempts per second a login gets
+        :param login_capacity: how many attempts a login can burst
+        :param client_rate: how many attempts per second a client gets
+        :param client_capacity: how many attempts a client can burst
+        :param costs: the cost of an attempt by strategy names, 1 by default
+        """
+        self.store = store if store is not None else MemoryTokenBucketStore()
+        self.login_rate = login_rate
+        self.login_capacity = login_capacity
+        self.client_rate = client_rate
+        self.client_capacity = client_capacity
+        self.costs = costs if costs is not None else self.default_costs
+
+    def admit(self, strategy_name, login=None, client_key=None):
+        """
+        Check if an attempt can go on and take its cost from the buckets.
+        :param strategy_name: a name of the strategy which makes the attempt
+        :param login: a login the attempt is made for
+        :param client_key: a key of the client, such as its address
+        """
+        cost = self.costs.get(strategy_name, 1)
+
+        if client_key is not None and not self.store.consume(
+                'client:{}'.format(client_key), cost, self.client_rate, self.client_capacity):
+            return False
+
+        if login is not None and not self.store.consume(
+                'login:{}'.format(login), cost, self.login_rate, self.login_capacity):
+            return False
+
+        return True
@@ -1,20 +1,18 @@
 # coding: utf-8
 
 from .interfaces import IViewDbDelegate
+from ..db import BakedFindByMixin
 
 
-class SAViewDbDelegate(IViewDbDelegate):
-    def __init__(self, db, model):
+class SAViewDbDelegate(BakedFindByMixin, IViewDbDelegate):
+    def __init__(self, db, model, load_only_fields=None):
+        """
+        :param load_only_fields: names of the columns to load, all by default
+        """
         self.db = db
         self.model = model
+        self.load_only_fields = tuple(load_only_fields) if load_only_fields else None
 
-    def find_by(self, **params):
-        criteria = []
-
-        for k, v in params.iteritems():
-            field = getattr(self.model, k, None)
-            if field is not None:
-                criteria.append(field == v)
-
-        if criteria:
-            return self.db.session.query(self.model).filter(self.db.or_(*criteria)).first()
+    def save(self, user):
+        self.db.session.add(user)
+        self.db.session.commit()
@@ -1,5 +1,6 @@
 # coding: utf-8
 
+from ..futures import submit
 from ..interfaces import IStrategy
 
 
@@ -15,6 +16,13 @@ class IAuthorizationStrategy(IStrategy):
     def authorize(self, error_callback=None):
         raise NotImplementedError()
 
+    def authorize_async(self, error_callback=None):
+        """
+        Like authorize, but return a concurrent.futures.Future. By default authorize runs
+        in the shared thread pool, an error raised by error_callback is set on the future.
+        """
+        return submit(self.authorize, error_callback)
+
 
 class IStrategyDataSource(object):
     def get_authorization_data(self):
@@ -25,7 +33,13 @@ class IUserLoader(object):
     def load(self, **params):
         raise NotImplementedError()
 
+    def save(self, user):
+        raise NotImplementedError()
+
 
 class IViewDbDelegate(object):
     def find_by(self, **params):
         raise NotImplementedError()
+
+    def save(self, user):
+        raise NotImplementedError()
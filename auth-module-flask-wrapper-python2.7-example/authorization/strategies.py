@@ -1,5 +1,7 @@
 # coding: utf-8
 
+import logging
+
 from .interfaces import IAuthorizationStrategy
 from ..errors import (
     AccountNotFound,
@@ -10,8 +12,13 @@ from ..errors import (
     WrongAuthorizationData,
 )
 from ..facebook_loader import FacebookSDKLoader
+from ..hashing import create_password_delegate
+from ..interfaces import IFacebookLoader
+from ..timing import phase
 from ...models import passwords
 
+logger = logging.getLogger(__name__)
+
 
 class FacebookStrategy(IAuthorizationStrategy):
     name = 'facebook'
@@ -26,14 +33,16 @@ class FacebookStrategy(IAuthorizationStrategy):
             error_callback(NoFacebookToken())
             return
 
-        faccount = self.get_facebook_account(facebook_token)
+        with phase('facebook'):
+            faccount = self.get_facebook_account(facebook_token)
 
         if not faccount:
             error_callback(IncorrectFacebookToken())
             return
 
         facebook_id = faccount['id']
-        user = self.user_loader.load(facebook_id=facebook_id)
+        with phase('user_lookup'):
+            user = self.user_loader.load(facebook_id=facebook_id)
 
         if not user:
             error_callback(FacebookNotFound())
@@ -42,13 +51,25 @@ class FacebookStrategy(IAuthorizationStrategy):
         return user
 
     def get_facebook_account(self, facebook_token):
-        fb_loader = self.facebook_loader()
+        fb_loader = self.create_facebook_loader()
         return fb_loader.load(facebook_token)
 
+    def create_facebook_loader(self):
+        # a loader instance, such as a shared cache, is used as is
+        if isinstance(self.facebook_loader, IFacebookLoader):
+            return self.facebook_loader
+
+        return self.facebook_loader()
+
 
 class SimpleStrategy(IAuthorizationStrategy):
     name = 'simple'
     password_delegate = passwords.Pbkdf2Sha512PasswordDelegate
+    hashing_executor = None  # sfkit.auth.hashing.IHashingExecutor
+    password_policy = None  # sfkit.auth.hashing.Pbkdf2Policy
+    password_hash_field = 'password'
+    #: set when a rehash didn't satisfy the password policy, then rehashing is turned off
+    password_policy_ignored = False
 
     def authorize(self, error_callback=None):
         data = self.data_source.get_authorization_data()
@@ -59,18 +80,48 @@ class SimpleStrategy(IAuthorizationStrategy):
             error_callback(NoCredentialDataProvided())
             return
 
-        user = self.user_loader.load(email=login)
+        with phase('user_lookup'):
+            user = self.user_loader.load(email=login)
 
         if user is None:
             error_callback(AccountNotFound())
             return
 
         user.password_delegate = self.create_password_delegate()
-        if not user.compare_passwords(password):
+        with phase('password_hash'):
+            is_correct = user.compare_passwords(password)
+
+        if not is_correct:
             error_callback(WrongAuthorizationData())
             return
 
+        if self.needs_rehash(user):
+            with phase('password_rehash'):
+                self.rehash(user, password)
+
         return user
 
+    def rehash(self, user, password):
+        """
+        Hash a known password with the current policy parameters and save the user.
+        """
+        user.password = password
+
+        if self.needs_rehash(user):
+            # the delegate doesn't take the policy parameters, so every sign in would hash twice
+            # and commit without changing anything
+            self.password_policy_ignored = True
+            logger.warning('%s ignores the attributes of %r, password rehashing is turned off',
+                           self.password_delegate, self.password_policy.get_delegate_attributes())
+            return
+
+        self.user_loader.save(user)
+
+    def needs_rehash(self, user):
+        if self.password_policy is None or self.password_policy_ignored:
+            return False
+
+        return self.password_policy.needs_rehash(getattr(user, self.password_hash_field, None))
+
     def create_password_delegate(self):
-        return self.password_delegate()
+        return create_password_delegate(self.password_delegate, self.hashing_executor, self.password_policy)
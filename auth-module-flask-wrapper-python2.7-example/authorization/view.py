@@ -1,6 +1,9 @@
 # coding: utf-8
 
-from flask import session
+from flask import (
+    request,
+    session,
+)
 
 from .interfaces import IUserLoader
 from .strategies import (
@@ -8,21 +11,24 @@ from .strategies import (
     SimpleStrategy,
 )
 from .. import StrategyRegistry
+from ..controllers import (
+    StrategyControllerMixin,
+    create_request_parser,
+)
 from ..errors import (
     StrategyNotDefined,
+    TooManyAttempts,
     UserIsNotActive
 )
 from ..login import login_user
+from ..timing import phase
 from ... import validation as val
 from ...errors import SFKitException
-from ...reqparser import (
-    RequestParser,
-    six
-)
+from ...reqparser import six
 from ...views import View
 
 
-class AuthorizationControllerView(IUserLoader, View):
+class AuthorizationControllerView(StrategyControllerMixin, IUserLoader, View):
     methods = ['POST']
 
     error_exception = SFKitException
@@ -31,47 +37,60 @@ class AuthorizationControllerView(IUserLoader, View):
         SimpleStrategy
     ]
     strategy_registry_class = StrategyRegistry
+    admission_controller = None  # sfkit.auth.admission.AdmissionController
+
+    request_parser = create_request_parser('type', 'facebook_token', 'login', 'password')
+    authorization_schema = val.Schema({
+        val.Optional('facebook_token'): val.Any(None, six.text_type),
+        val.Optional('login'): val.Any(None, val.All(val.normalize(), val.email())),
+        val.Optional('password'): val.Any(None, six.text_type),
+    }, extra=True)
 
     def __init__(self, db_delegate):
         self.db_delegate = db_delegate
-
-        self.strategy_registry = self._create_strategy_registry()
-        self._add_strategies(self.strategy_registry)
+        self.strategy_registry = self._bind_strategy_registry()
 
     def post(self):
-        user = self.apply_strategy(self.strategy_registry.find())
+        with phase('strategy_lookup'):
+            strategy = self.strategy_registry.find()
+
+        with phase('strategy'):
+            user = self.apply_strategy(strategy)
 
         if self.will_sign_in(user) and user is not None and login_user(user):
             self.did_sign_in(user)
-            return self.build_response({'token': self._generate_token()})
+
+            with phase('token'):
+                token = self._generate_token()
+
+            return self.build_response({'token': token})
 
         self.error_handler(UserIsNotActive())
 
     def apply_strategy(self, strategy=None):
         if strategy is not None:
+            if not self.admit(strategy):
+                self.error_handler(TooManyAttempts())
+
             return strategy.authorize(self.error_handler)
 
         self.error_handler(StrategyNotDefined())
 
-    def get_type_name(self):
-        parser = RequestParser()
-        parser.add_argument('type')
-        args = parser.parse_args()
-        return args['type']
+    def admit(self, strategy):
+        if self.admission_controller is None:
+            return True
 
-    def get_authorization_data(self):
-        parser = RequestParser()
-        parser.add_argument('facebook_token')
-        parser.add_argument('login')
-        parser.add_argument('password')
+        login = self.get_authorization_data().get('login')
+        return self.admission_controller.admit(strategy.name, login=login, client_key=self.get_client_key())
 
-        schema = val.Schema({
-            val.Optional('facebook_token'): val.Any(None, six.text_type),
-            val.Optional('login'): val.Any(None, val.All(val.normalize(), val.email())),
-            val.Optional('password'): val.Any(None, six.text_type),
-        }, extra=True)
+    def get_client_key(self):
+        return request.remote_addr
+
+    def get_type_name(self):
+        return self.get_request_args()['type']
 
-        return schema(parser.parse_args())
+    def get_authorization_data(self):
+        return self.authorization_schema(self.get_request_args())
 
     def error_handler(self, error):
         raise self.error_exception(error)
@@ -79,6 +98,9 @@ class AuthorizationControllerView(IUserLoader, View):
     def load(self, **params):
         return self.db_delegate.find_by(**params)
 
+    def save(self, user):
+        self.db_delegate.save(user)
+
     def will_sign_in(self, user):
         return True
 
@@ -89,15 +111,6 @@ class AuthorizationControllerView(IUserLoader, View):
     def register(cls, app, endpoint='signin', url="/signin/", view_args=None, view_kwargs=None, **kwargs):
         super(AuthorizationControllerView, cls).register(app, url, endpoint, view_args, view_kwargs, **kwargs)
 
-    def _create_strategy_registry(self):
-        return self.strategy_registry_class(self)
-
-    def _add_strategies(self, strategy_registry):
-        for strategy in self.strategies:
-            strategy = strategy(self, self)
-            strategy.delegate = self
-            strategy_registry.add(strategy)
-
     def _generate_token(self):
         session.generate_new()
         return session.key
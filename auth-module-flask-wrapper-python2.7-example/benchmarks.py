@@ -0,0 +1,445 @@
+# coding: utf-8
+"""
+Benchmarks of the auth module. Run them as a module, for example:
+
+    python -m sfkit.auth.benchmarks auth codecs imports
+
+The auth benchmark runs a flask application with an in-memory SQLite database. Passwords are hashed
+with BENCH_PBKDF2_ITERATIONS iterations to keep the focus on the auth overhead.
+
+Every benchmark prints its results as JSON, so runs can be compared across commits.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import timeit
+import uuid
+
+SESSION_PAYLOADS = {
+    'anonymous': {
+        '_fresh': False,
+    },
+    'signed_in': {
+        'user_id': 184467,
+        '_fresh': True,
+        'csrf_token': uuid.uuid4().hex,
+    },
+    'busy': {
+        'user_id': 184467,
+        '_fresh': True,
+        'csrf_token': uuid.uuid4().hex,
+        'locale': u'en_US',
+        'timezone': u'Europe/Berlin',
+        '_flashes': [[u'message', u'Your profile has been updated']],
+        'recent_searches': [u'apartment near the river {}'.format(i) for i in range(20)],
+        'cart': [{'item_id': i, 'quantity': i % 3 + 1, 'price': u'{}.99'.format(i)} for i in range(30)],
+    },
+}
+
+
+def measure(func, number):
+    """
+    Call func number times and return the mean time of a call in microseconds.
+    """
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def bench_codecs(number=10000):
+    from .session import codecs
+
+    results = []
+    candidates = [('json', codecs.JSONCodec())]
+
+    if codecs.msgpack is not None:
+        candidates.append(('msgpack', codecs.MsgpackCodec()))
+
+    for payload_name, payload in sorted(SESSION_PAYLOADS.items()):
+        legacy_size = len(json.dumps(payload))
+
+        for codec_name, codec in candidates:
+            encoded = codec.encode(payload)
+            results.append({
+                'payload': payload_name,
+                'codec': codec_name,
+                'legacy_bytes': legacy_size,
+                'bytes': len(encoded),
+                'encode_us': measure(lambda: codec.encode(payload), number),
+                'decode_us': measure(lambda: codec.decode(encoded), number),
+            })
+
+    return results
+
+
+BENCH_PBKDF2_ITERATIONS = 1000
+
+
+class BenchPasswordDelegate(object):
+    """
+    A cheap PBKDF2 password delegate, so the benchmarks measure the auth overhead rather than hashing.
+    """
+    iterations = BENCH_PBKDF2_ITERATIONS
+
+    def hash(self, password):
+        import binascii
+        import hashlib
+        import os
+
+        salt = binascii.hexlify(os.urandom(8)).decode('ascii')
+        checksum = hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'), salt.encode('ascii'), self.iterations)
+        return '$pbkdf2-sha512${}${}${}'.format(self.iterations, salt, binascii.hexlify(checksum).decode('ascii'))
+
+    def compare(self, password, hashed):
+        import binascii
+        import hashlib
+
+        _, _, iterations, salt, checksum = hashed.split('$')
+        expected = hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'), salt.encode('ascii'), int(iterations))
+        return binascii.hexlify(expected).decode('ascii') == checksum
+
+
+def create_bench_db(users=1000):
+    """
+    Create an in-memory SQLite database with users and sessions tables, shaped like the db object
+    of Flask-SQLAlchemy.
+    :return: a tuple (db, user model, session model)
+    """
+    import sqlalchemy as sa
+    from sqlalchemy.ext.declarative import declarative_base
+    from sqlalchemy.orm import (
+        scoped_session,
+        sessionmaker,
+    )
+    from sqlalchemy.pool import StaticPool
+
+    from .login import UserMixin
+
+    Base = declarative_base()
+
+    class User(UserMixin, Base):
+        __tablename__ = 'users'
+
+        id = sa.Column(sa.Integer, primary_key=True)
+        email = sa.Column(sa.String(255), unique=True)
+        facebook_id = sa.Column(sa.String(64), unique=True)
+        password_hash = sa.Column('password', sa.String(255))
+        first_name = sa.Column(sa.String(255))
+        last_name = sa.Column(sa.String(255))
+        about = sa.Column(sa.Text)
+
+        password_delegate = BenchPasswordDelegate()
+
+        @property
+        def password(self):
+            return self.password_hash
+
+        @password.setter
+        def password(self, value):
+            self.password_hash = self.password_delegate.hash(value)
+
+        def compare_passwords(self, password):
+            return self.password_delegate.compare(password, self.password_hash)
+
+    class SessionRow(Base):
+        __tablename__ = 'sessions'
+
+        session_id = sa.Column(sa.String(255), primary_key=True)
+        session_data = sa.Column(sa.PickleType)
+        expiration_date = sa.Column(sa.DateTime, index=True)
+
+    # a single connection, so every session sees the same in-memory database
+    engine = sa.create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+
+    class DB(object):
+        or_ = staticmethod(sa.or_)
+        exists = staticmethod(sa.exists)
+        session = scoped_session(sessionmaker(bind=engine))
+
+    password = BenchPasswordDelegate().hash(u'password')
+    DB.session.add_all(User(email='user{}@example.com'.format(i),
+                            facebook_id=str(10 ** 9 + i),
+                            password_hash=password,
+                            first_name='First',
+                            last_name='Last',
+                            about='about me ' * 50) for i in range(users))
+    DB.session.commit()
+    return DB, User, SessionRow
+
+
+def bench_find_by(number=2000):
+    from .authorization.db import SAViewDbDelegate
+
+    db, User, _ = create_bench_db()
+
+    def find_by_reflection(**params):
+        # the find_by implementation before the queries were baked
+        criteria = []
+        for k, v in params.items():
+            field = getattr(User, k, None)
+            if field is not None:
+                criteria.append(field == v)
+        return db.session.query(User).filter(db.or_(*criteria)).first()
+
+    baked = SAViewDbDelegate(db, User)
+    projected = SAViewDbDelegate(db, User, load_only_fields=['id', 'email', 'password_hash'])
+
+    results = []
+    for name, find_by in [('reflection', find_by_reflection),
+                          ('baked', baked.find_by),
+                          ('baked_load_only', projected.find_by)]:
+        def call():
+            find_by(email='user500@example.com')
+            db.session.expunge_all()
+
+        results.append({'implementation': name, 'per_call_us': measure(call, number)})
+
+    return results
+
+
+def measure_latencies(func, number, warmup=10):
+    """
+    Call func number times after a warm up.
+    :return: a dict with the throughput per second and latency percentiles in milliseconds
+    """
+    timer = timeit.default_timer
+
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    started_at = timer()
+
+    for _ in range(number):
+        call_started_at = timer()
+        func()
+        latencies.append(timer() - call_started_at)
+
+    elapsed = timer() - started_at
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+    return {
+        'requests': number,
+        'throughput': number / elapsed,
+        'mean_ms': sum(latencies) / number * 1000,
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def create_auth_app(users=1000):
+    """
+    Create a flask application with sign in, sign up, sessions in SQLite and a login_required route.
+    Facebook calls go to a stub loader.
+    :return: a tuple (app, db, user model)
+    """
+    from flask import Flask
+
+    from .authorization.db import SAViewDbDelegate as AuthorizationDbDelegate
+    from .authorization.strategies import (
+        FacebookStrategy as FacebookAuthorizationStrategy,
+        SimpleStrategy as SimpleAuthorizationStrategy,
+    )
+    from .authorization.view import AuthorizationControllerView
+    from .interfaces import IFacebookLoader
+    from .login import (
+        LoginManager,
+        current_user,
+        login_required,
+    )
+    from .registration.db import SAViewDbDelegate as RegistrationDbDelegate
+    from .registration.strategies import SimpleStrategy as SimpleRegistrationStrategy
+    from .registration.view import RegistrationControllerView
+    from .session import SessionExtension
+    from .session.backends import SQLAlchemySessionBackend
+    from .session.sources import HeaderSource
+
+    db, User, SessionRow = create_bench_db(users)
+
+    class StubFacebookLoader(IFacebookLoader):
+        def load(self, facebook_token):
+            if facebook_token.startswith('fb-'):
+                return {'id': facebook_token[3:]}
+
+    class BenchSimpleAuthorizationStrategy(SimpleAuthorizationStrategy):
+        password_delegate = BenchPasswordDelegate
+
+    class BenchFacebookAuthorizationStrategy(FacebookAuthorizationStrategy):
+        facebook_loader = StubFacebookLoader()
+
+    class BenchAuthorizationView(AuthorizationControllerView):
+        strategies = [BenchFacebookAuthorizationStrategy, BenchSimpleAuthorizationStrategy]
+
+    class BenchSimpleRegistrationStrategy(SimpleRegistrationStrategy):
+        password_delegate = BenchPasswordDelegate
+
+    class BenchRegistrationView(RegistrationControllerView):
+        strategies = [BenchSimpleRegistrationStrategy]
+
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+
+    SessionExtension(SQLAlchemySessionBackend(db.session, SessionRow), HeaderSource(), app)
+
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: db.session.query(User).get(user_id))
+
+    BenchAuthorizationView.register(app, view_args=[AuthorizationDbDelegate(db, User)])
+    BenchRegistrationView.register(app, view_args=[RegistrationDbDelegate(db, User)])
+
+    @app.route('/me/')
+    @login_required
+    def me():
+        return str(current_user.id)
+
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        db.session.remove()
+
+    return app, db, User
+
+
+def bench_auth(number=500, users=1000):
+    from flask import request
+
+    from .cache import TTLCache
+    from .db import UserSnapshots
+    from .session.sources import HeaderSource
+
+    app, db, User = create_auth_app(users)
+    client = app.test_client()
+    header_name = HeaderSource.default_header_name
+
+    def post(url, data):
+        response = client.post(url, data=json.dumps(data), content_type='application/json')
+        assert response.status_code < 300, response.data
+        return response
+
+    def sign_in():
+        return post('/signin/', {'type': 'simple', 'login': 'user1@example.com', 'password': u'password'})
+
+    def facebook_sign_in():
+        post('/signin/', {'type': 'facebook', 'facebook_token': 'fb-{}'.format(10 ** 9 + 2)})
+
+    signups = iter(range(10 ** 9))
+
+    def sign_up():
+        post('/signup/', {'type': 'simple',
+                          'login': 'new{}@example.com'.format(next(signups)),
+                          'password': u'password'})
+
+    token = json.loads(sign_in().data.decode('utf-8'))['token']
+
+    def get_me():
+        response = client.get('/me/', headers={header_name: token})
+        assert response.status_code == 200, response.data
+
+    session_interface = app.session_interface
+
+    def open_and_save_session():
+        with app.test_request_context('/', headers={header_name: token}):
+            session = session_interface.open_session(app, request)
+            session['counter'] = session.get('counter', 0) + 1
+            session_interface.save_session(app, session, None)
+
+    results = {
+        'signin_simple': measure_latencies(sign_in, number),
+        'signin_facebook': measure_latencies(facebook_sign_in, number),
+        'signup_simple': measure_latencies(sign_up, number),
+        'session_open_save': measure_latencies(open_and_save_session, number),
+        'login_required_cold_user': measure_latencies(get_me, number),
+    }
+
+    snapshots = UserSnapshots(db, User)
+    app.login_manager.user_cache = TTLCache(1000, 60)
+    app.login_manager.user_cacher(snapshots.snapshot)
+    app.login_manager.user_reattacher(snapshots.reattach)
+    results['login_required_warm_user'] = measure_latencies(get_me, number)
+
+    return results
+
+
+#: modules which only facebook sign in needs
+HEAVY_MODULES = ('facebook', 'requests', 'urllib3')
+
+IMPORT_SCRIPT = """
+import json, sys, timeit
+started_at = timeit.default_timer()
+import {module}
+elapsed = timeit.default_timer() - started_at
+print(json.dumps({{'seconds': elapsed, 'loaded': sorted(name for name in {heavy!r} if name in sys.modules)}}))
+"""
+
+
+def bench_imports(number=5):
+    """
+    Measure the cold import time of the views in fresh interpreters. The facebook import shows
+    the cost which the views don't pay until facebook sign in is used.
+    """
+    package = __package__ or 'sfkit.auth'
+    results = []
+
+    for module in ['{}.authorization.view'.format(package),
+                   '{}.registration.view'.format(package),
+                   'facebook']:
+        script = IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+        timings = []
+        result = {'module': module}
+
+        for _ in range(number):
+            process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, err = process.communicate()
+
+            if process.returncode:
+                result['error'] = err.decode('utf-8').strip().splitlines()[-1]
+                break
+
+            run = json.loads(out.decode('utf-8'))
+            timings.append(run['seconds'])
+            result['loaded'] = run['loaded']
+
+        if timings:
+            timings.sort()
+            result['import_ms'] = timings[len(timings) // 2] * 1000
+
+        results.append(result)
+
+    return results
+
+
+BENCHMARKS = {
+    'auth': bench_auth,
+    'codecs': bench_codecs,
+    'find_by': bench_find_by,
+    'imports': bench_imports,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run auth module benchmarks.')
+    parser.add_argument('names', nargs='*', choices=sorted(BENCHMARKS), help='benchmarks to run, all by default')
+    args = parser.parse_args(argv)
+
+    results = {
+        'meta': {
+            'python': sys.version.split()[0],
+            'time': time.time(),
+        },
+    }
+
+    for name in args.names or sorted(BENCHMARKS):
+        results[name] = BENCHMARKS[name]()
+
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    print()
+
+
+if __name__ == '__main__':
+    main()
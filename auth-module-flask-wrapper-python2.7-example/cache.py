@@ -0,0 +1,90 @@
+# coding: utf-8
+
+import threading
+import time
+from collections import OrderedDict
+
+_clock = getattr(time, 'monotonic', time.time)
+_missing = object()
+
+
+class TTLCache(object):
+    """
+    A thread-safe LRU cache which also expires entries after a time to live.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        """
+        Constructor.
+        :param maxsize: the maximum number of entries, the least recently used one is evicted first
+        :param ttl: how long an entry lives in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return a cached value or the default if there is no alive entry for the key.
+        """
+        with self._lock:
+            entry = self._data.pop(key, _missing)
+
+            if entry is not _missing and entry[1] > _clock():
+                # put it back as the most recently used one
+                self._data[key] = entry
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Put a value to the cache.
+        :param ttl: overrides the default time to live for this entry
+        """
+        expires_at = _clock() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires_at)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """
+        Delete the entries for which predicate(key, value) is true.
+        :return: how many entries were deleted
+        """
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+        }
+
+    def __len__(self):
+        return len(self._data)
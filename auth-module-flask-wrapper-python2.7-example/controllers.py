@@ -0,0 +1,145 @@
+# coding: utf-8
+
+import threading
+
+from flask import _request_ctx_stack
+from werkzeug.local import LocalProxy
+
+from .timing import phase
+from ..reqparser import RequestParser
+
+
+def _get_function(cls, name):
+    attr = getattr(cls, name)
+    return getattr(attr, '__func__', attr)
+
+
+def create_request_parser(*names):
+    """
+    Create a request parser with the arguments.
+    """
+    parser = RequestParser()
+    for name in names:
+        parser.add_argument(name)
+    return parser
+
+
+class StrategyControllerMixin(object):
+    """
+    A base of controller views which apply strategies.
+
+    The strategy registry is built once per view class. Its strategies are shared between requests
+    and use the view instance of the current request through a proxy. The request is parsed once
+    with request_parser.
+
+    Besides strategy classes, strategies can hold (name, dotted path) tuples of strategies which are
+    imported on the first request which uses them. Strategies of strategy_entry_point_group are
+    added the same way.
+
+    The shared registry is built with the _create_shared_strategy_registry and _add_shared_strategies
+    class hooks. Views which override the instance hooks _create_strategy_registry or _add_strategies
+    build their registry on every request instead, as they did before it was shared.
+    """
+    strategies = []
+    strategy_registry_class = None
+    strategy_entry_point_group = None
+    request_parser = None
+
+    _registry_lock = threading.Lock()
+    _request_args = None
+
+    def _bind_strategy_registry(self):
+        """
+        Make the view the current one for its strategies and return their registry.
+        """
+        if self._overrides_instance_hooks():
+            strategy_registry = self._create_strategy_registry()
+            self._add_strategies(strategy_registry)
+            return strategy_registry
+
+        ctx = _request_ctx_stack.top
+
+        if ctx is None:
+            raise RuntimeError('{} shares its strategies between requests through the request context, '
+                               'create it within a request'.format(type(self).__name__))
+
+        views = getattr(ctx, 'auth_controller_views', None)
+
+        if views is None:
+            views = ctx.auth_controller_views = {}
+
+        views[type(self)] = self
+        return self._get_strategy_registry()
+
+    def get_request_args(self):
+        """
+        Parse the request arguments, they are parsed only once per request.
+        """
+        if self._request_args is None:
+            with phase('parse'):
+                self._request_args = self.request_parser.parse_args()
+
+        return self._request_args
+
+    @classmethod
+    def _get_strategy_registry(cls):
+        registry = cls.__dict__.get('_strategy_registry')
+
+        if registry is None:
+            with cls._registry_lock:
+                registry = cls.__dict__.get('_strategy_registry')
+
+                if registry is None:
+                    view = LocalProxy(lambda: _request_ctx_stack.top.auth_controller_views[cls])
+                    registry = cls._create_shared_strategy_registry(view)
+                    cls._add_shared_strategies(registry, view)
+                    cls._strategy_registry = registry
+
+        return registry
+
+    @classmethod
+    def _overrides_instance_hooks(cls):
+        return any(_get_function(cls, name) is not _get_function(StrategyControllerMixin, name)
+                   for name in ('_create_strategy_registry', '_add_strategies'))
+
+    def _create_strategy_registry(self):
+        """
+        Create a strategy registry of this view instance.
+        :return: a strategy registry
+        :rtype sfkit.auth.StrategyRegistry
+        """
+        return self._create_shared_strategy_registry(self)
+
+    def _add_strategies(self, strategy_registry):
+        """
+        Add the strategies bound to this view instance to a registry.
+        """
+        self._add_shared_strategies(strategy_registry, self)
+
+    @classmethod
+    def _create_shared_strategy_registry(cls, view):
+        """
+        :param view: the view of a registry, a proxy of the current view for the shared one
+        :return: a strategy registry
+        :rtype sfkit.auth.StrategyRegistry
+        """
+        return cls.strategy_registry_class(view)
+
+    @classmethod
+    def _add_shared_strategies(cls, strategy_registry, view):
+        strategy_registry.strategy_factory = lambda strategy_class: cls._create_strategy(strategy_class, view)
+
+        for strategy in cls.strategies:
+            if isinstance(strategy, tuple):
+                strategy_registry.add_lazy(*strategy)
+            else:
+                strategy_registry.add(cls._create_strategy(strategy, view))
+
+        if cls.strategy_entry_point_group is not None:
+            strategy_registry.add_entry_points(cls.strategy_entry_point_group)
+
+    @classmethod
+    def _create_strategy(cls, strategy_class, view):
+        strategy = strategy_class(view, view)
+        strategy.delegate = view
+        return strategy
@@ -0,0 +1,157 @@
+# coding: utf-8
+
+from sqlalchemy import (
+    Index,
+    bindparam,
+    func,
+    inspect as sa_inspect,
+    or_,
+    text,
+)
+from sqlalchemy.ext import baked
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import (
+    load_only,
+    make_transient_to_detached,
+)
+from sqlalchemy.orm.util import identity_key
+
+bakery = baked.bakery()
+
+
+def normalize_email(value):
+    return value.strip().lower() if value is not None else None
+
+
+class NormalizedEmailMixin(object):
+    """
+    A user model mixin which adds a unique index on lower(email). The view delegates look emails up
+    through this index, so sign in and the uniqueness check are a single index probe.
+    The model should define an email column and shouldn't define its own __table_args__.
+    """
+    __normalized_fields__ = ('email',)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (
+            Index('ix_{}_email_lower'.format(cls.__tablename__), func.lower(cls.email), unique=True),
+        )
+
+
+def create_normalized_email_index(op, table_name, column_name='email', index_name=None):
+    """
+    Create the index of NormalizedEmailMixin in an alembic migration. The creation fails if there are
+    emails which differ only in case, merge such accounts first.
+    :param op: alembic.op
+    """
+    index_name = index_name if index_name is not None else 'ix_{}_{}_lower'.format(table_name, column_name)
+    op.create_index(index_name, table_name, [text('lower({})'.format(column_name))], unique=True)
+
+
+def drop_normalized_email_index(op, table_name, column_name='email', index_name=None):
+    """
+    Drop the index of NormalizedEmailMixin in an alembic migration.
+    :param op: alembic.op
+    """
+    index_name = index_name if index_name is not None else 'ix_{}_{}_lower'.format(table_name, column_name)
+    op.drop_index(index_name, table_name)
+
+
+class BakedFindByMixin(object):
+    """
+    A find_by implementation which compiles a query once for every set of fields and reuses it.
+    If load_only_fields is set, only these columns are loaded, others are loaded on access.
+    Fields listed in __normalized_fields__ of the model are compared by lower(field).
+    """
+    db = None
+    model = None
+    load_only_fields = None
+
+    def find_by(self, **params):
+        fields = tuple(sorted(k for k in params if getattr(self.model, k, None) is not None))
+
+        if fields:
+            query = self._get_find_query(fields)
+            return query(self.db.session()).params(
+                **dict((k, self._get_field_value(k, params[k])) for k in fields)).first()
+
+    def _get_field_expression(self, name):
+        field = getattr(self.model, name)
+        return func.lower(field) if name in self._get_normalized_fields() else field
+
+    def _get_field_value(self, name, value):
+        return normalize_email(value) if name in self._get_normalized_fields() else value
+
+    def _get_normalized_fields(self):
+        return getattr(self.model, '__normalized_fields__', ())
+
+    def _get_find_query(self, fields):
+        queries = self.__dict__.setdefault('_find_queries', {})
+
+        if fields not in queries:
+            model = self.model
+            load_only_fields = self.load_only_fields
+            criteria = [self._get_field_expression(k) == bindparam(k) for k in fields]
+
+            # the arguments are a part of the cache key of a baked query
+            query = bakery(lambda session: session.query(model), model)
+            query.add_criteria(lambda q: q.filter(or_(*criteria)), fields, self._get_normalized_fields())
+
+            if load_only_fields:
+                query.add_criteria(lambda q: q.options(load_only(*load_only_fields)), load_only_fields)
+
+            queries[fields] = query
+
+        return queries[fields]
+
+
+class UserSnapshots(object):
+    """
+    Keeps users in sfkit.auth.login.LoginManager.user_cache as plain column values instead of ORM instances,
+    which would be expired by the next commit and bound to the session of another request:
+
+        snapshots = UserSnapshots(db, User)
+        login_manager.user_cacher(snapshots.snapshot)
+        login_manager.user_reattacher(snapshots.reattach)
+
+    A reattached user is attached to the current session without a query. Relationships are still loaded
+    on access.
+    """
+
+    def __init__(self, db, model):
+        """
+        Constructor.
+        :param db: a db object of Flask-SQLAlchemy
+        :param model: a user model
+        """
+        self.db = db
+        self.model = model
+
+    def snapshot(self, user):
+        """
+        Return the column values of a user, expired ones are loaded.
+        """
+        return dict((attr.key, getattr(user, attr.key)) for attr in sa_inspect(user).mapper.column_attrs)
+
+    def reattach(self, values):
+        """
+        Build a persistent user of the current session from a snapshot.
+        """
+        session = self.db.session()
+        mapper = sa_inspect(self.model)
+        key = identity_key(self.model, tuple(values[mapper.get_property_by_column(column).key]
+                                             for column in mapper.primary_key))
+
+        # the user could have been loaded in this request already
+        user = session.identity_map.get(key)
+        if user is not None:
+            return user
+
+        user = self.model()
+        for name, value in values.items():
+            setattr(user, name, value)
+
+        # the values become the loaded state, as if the user were selected
+        make_transient_to_detached(user)
+        session.add(user)
+        return user
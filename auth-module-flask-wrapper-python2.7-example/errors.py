@@ -45,6 +45,16 @@ class NoCredentialDataProvided(AuthError):
     description = 'No login or/and password'
 
 
+class InvalidRegistrationData(AuthError):
+    namespace = 'invalidRegistrationData'
+    description = 'Invalid registration data'
+
+
+class RegistrationDeclined(AuthError):
+    namespace = 'registrationDeclined'
+    description = 'The registration has been declined'
+
+
 class WrongAuthorizationData(AuthError):
     namespace = "wrongAuthData"
     description = 'Wrong authorization data'
@@ -53,3 +63,8 @@ class WrongAuthorizationData(AuthError):
 class UserIsNotActive(AuthError):
     namespace = 'noActiveAccount'
     description = 'The user not active'
+
+
+class TooManyAttempts(AuthError):
+    namespace = 'tooManyAttempts'
+    description = 'Too many sign in attempts, try again later'
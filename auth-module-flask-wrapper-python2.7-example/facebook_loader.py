@@ -1,12 +1,25 @@
 # coding: utf-8
 
-import facebook
+import hashlib
+import json
+import random
+import threading
+import time
 
+from .cache import TTLCache
+from .futures import (
+    completed,
+    submit,
+)
 from .interfaces import IFacebookLoader
 
 
 class FacebookSDKLoader(IFacebookLoader):
     def load(self, facebook_token):
+        # the SDK and its HTTP stack are imported on the first use, processes which never
+        # sign in with facebook don't pay for them
+        import facebook
+
         faccount = None
 
         try:
@@ -16,3 +29,201 @@ class FacebookSDKLoader(IFacebookLoader):
             pass
 
         return faccount
+
+
+class GraphUnavailable(Exception):
+    """
+    The Graph API can't be reached or fails on its side.
+    """
+
+
+class PooledFacebookLoader(IFacebookLoader):
+    """
+    A facebook loader which keeps connections to the Graph API alive in a thread-safe pool.
+    Share one instance between strategies, so the connections are reused.
+
+    Invalid tokens give None like FacebookSDKLoader does. Network errors and server errors are retried
+    with an exponential backoff and jitter, then GraphUnavailable is raised. Throttling raises
+    GraphUnavailable right away.
+
+    load_async runs in a thread pool of the loader with a thread for every pooled connection,
+    so slow Graph API calls don't hold the threads of the shared pool.
+    """
+    default_graph_url = 'https://graph.facebook.com'
+    #: error codes of rate limits: application, user, page and custom
+    throttling_error_codes = frozenset([4, 17, 32, 613])
+    #: error codes of invalid, expired or revoked tokens
+    token_error_codes = frozenset([102, 190, 2500])
+
+    def __init__(self, graph_url=None, version=None, fields=None, pool_size=10, connect_timeout=2.0,
+                 read_timeout=5.0, retries=2, backoff=0.1):
+        """
+        Constructor.
+        :param graph_url: a Graph API base url, for example a local stub server in tests
+        :param version: a Graph API version, such as 'v2.8'
+        :param fields: a list of account fields to request
+        :param pool_size: how many connections are kept, requests wait for a free one
+        :param connect_timeout: a connect timeout in seconds
+        :param read_timeout: a read timeout in seconds
+        :param retries: how many times a failed request is retried
+        :param backoff: a pause before the first retry in seconds, it doubles with every retry
+        """
+        import urllib3
+
+        graph_url = (graph_url if graph_url is not None else self.default_graph_url).rstrip('/')
+        self.url = '/'.join(part for part in (graph_url, version, 'me') if part)
+        self.fields = fields
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+
+        self.pool = urllib3.PoolManager(maxsize=pool_size,
+                                        block=True,
+                                        timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+                                        retries=False)
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def load(self, facebook_token):
+        import urllib3
+
+        params = {'access_token': facebook_token}
+        if self.fields:
+            params['fields'] = ','.join(self.fields)
+
+        attempt = 0
+
+        while True:
+            try:
+                response = self.pool.request('GET', self.url, fields=params)
+            except urllib3.exceptions.HTTPError as e:
+                error = GraphUnavailable(str(e))
+            else:
+                if response.status < 500:
+                    return self._parse(response)
+                error = GraphUnavailable('The Graph API responded with {}'.format(response.status))
+
+            if attempt >= self.retries:
+                raise error
+
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def load_async(self, facebook_token):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.pool_size)
+
+        return self._executor.submit(self.load, facebook_token)
+
+    def _parse(self, response):
+        try:
+            body = json.loads(response.data.decode('utf-8'))
+        except ValueError:
+            body = None
+
+        if not isinstance(body, dict):
+            raise GraphUnavailable('The Graph API responded with {} and an unexpected body'.format(response.status))
+
+        error = body.get('error')
+
+        if response.status == 200 and error is None:
+            return body
+
+        error = error if isinstance(error, dict) else {}
+
+        if response.status == 429 or error.get('code') in self.throttling_error_codes:
+            # throttling says nothing about the token, so it mustn't be taken for an invalid one
+            raise GraphUnavailable('The Graph API is throttling requests: {}'.format(error.get('message')))
+
+        if error.get('type') == 'OAuthException' or error.get('code') in self.token_error_codes:
+            # an invalid or expired token
+            return None
+
+        raise GraphUnavailable('The Graph API responded with {}: {}'.format(response.status, error.get('message')))
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CachedFacebookLoader(IFacebookLoader):
+    """
+    A cache in front of another facebook loader. Accounts are cached by their tokens, invalid tokens
+    are cached for a shorter time. Concurrent loads of the same token wait for a single call.
+
+    Share one instance between strategies, for example by setting it as their facebook_loader.
+    """
+    _missing = object()
+
+    def __init__(self, loader, maxsize=10000, ttl=5 * 60, negative_ttl=30):
+        """
+        Constructor.
+        :param sfkit.auth.interfaces.IFacebookLoader loader: a loader to wrap
+        :param maxsize: how many tokens to keep
+        :param ttl: how long an account is cached in seconds
+        :param negative_ttl: how long an invalid token is cached in seconds
+        """
+        self.loader = loader
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize, ttl)
+
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def load_async(self, facebook_token):
+        # cached accounts don't need a thread
+        faccount = self.cache.get(self._get_key(facebook_token), self._missing)
+        if faccount is not self._missing:
+            return completed(faccount)
+
+        return submit(self.load, facebook_token)
+
+    def load(self, facebook_token):
+        key = self._get_key(facebook_token)
+
+        faccount = self.cache.get(key, self._missing)
+        if faccount is not self._missing:
+            return faccount
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+
+            if is_leader:
+                # it could have been loaded while we were waiting for the lock
+                faccount = self.cache.get(key, self._missing)
+                if faccount is not self._missing:
+                    return faccount
+
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.loader.load(facebook_token)
+            self.cache.set(key, call.result, ttl=None if call.result is not None else self.negative_ttl)
+            return call.result
+        except Exception as e:
+            # errors such as network failures are shared with the waiting callers, but not cached
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    @staticmethod
+    def _get_key(facebook_token):
+        # don't keep raw tokens in memory
+        return hashlib.sha256(facebook_token.encode('utf-8')).hexdigest()
@@ -0,0 +1,87 @@
+# coding: utf-8
+"""
+Future based counterparts of the blocking auth interfaces.
+
+The *_async methods return a concurrent.futures.Future. By default they run the blocking methods
+in a shared thread pool within a copy of the current flask context, so several database round trips
+and Graph API calls of a request can overlap.
+"""
+
+import threading
+
+from flask import (
+    copy_current_request_context,
+    current_app,
+    has_app_context,
+    has_request_context,
+)
+
+DEFAULT_MAX_WORKERS = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the shared thread pool, it's created on the first call.
+    """
+    global _executor
+
+    # the futures backport is needed only when the *_async methods are used
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(DEFAULT_MAX_WORKERS)
+        return _executor
+
+
+def set_executor(executor):
+    """
+    Replace the shared thread pool, for example with a bigger one.
+    :param concurrent.futures.Executor executor:
+    """
+    global _executor
+
+    with _executor_lock:
+        _executor = executor
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run func in the shared thread pool within a copy of the current request or application context.
+    :return: a future of the func result
+    """
+    return submit_to(get_executor(), func, *args, **kwargs)
+
+
+def submit_to(executor, func, *args, **kwargs):
+    """
+    Like submit, but runs func in the executor.
+    """
+    if has_request_context():
+        func = copy_current_request_context(func)
+    elif has_app_context():
+        func = _with_app_context(current_app._get_current_object(), func)
+
+    return executor.submit(func, *args, **kwargs)
+
+
+def completed(result):
+    """
+    Return a future which is already done with the result.
+    """
+    from concurrent.futures import Future
+
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _with_app_context(app, func):
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,302 @@
+# coding: utf-8
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import click
+
+logger = logging.getLogger(__name__)
+
+
+def _call(func, args, kwargs):
+    # errors of func are returned, so the caller can tell them from failures of the pool
+    started_at = time.time()
+    try:
+        return func(*args, **kwargs), None, started_at
+    except Exception as e:
+        return None, e, started_at
+
+
+def _call_delegate(delegate_class, attributes, name, args, kwargs):
+    return getattr(_create_delegate(delegate_class, attributes), name)(*args, **kwargs)
+
+
+def _create_delegate(delegate_class, attributes):
+    delegate = delegate_class()
+    for name, value in attributes.items():
+        setattr(delegate, name, value)
+    return delegate
+
+
+def create_password_delegate(delegate_class, executor=None, policy=None):
+    """
+    Create a password delegate.
+    :param delegate_class: a password delegate class, such as sfkit.models.passwords.Pbkdf2Sha512PasswordDelegate
+    :param IHashingExecutor executor: an executor to run the delegate methods with, they run inline if it's not set
+    :param Pbkdf2Policy policy: a policy to configure the delegate with
+    """
+    attributes = policy.get_delegate_attributes() if policy is not None else {}
+
+    if executor is not None:
+        return OffloadedPasswordDelegate(delegate_class, executor, attributes)
+
+    return _create_delegate(delegate_class, attributes)
+
+
+class IHashingExecutor(object):
+    """
+    Runs CPU heavy password hashing
+    """
+
+    def run(self, func, *args, **kwargs):
+        """
+        Call func with the arguments and return its result.
+        """
+        raise NotImplementedError()
+
+
+class HashingMetrics(object):
+    def __init__(self):
+        self.calls = 0
+        self.sync_calls = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.run_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, queue_time, run_time, sync=False):
+        with self._lock:
+            self.calls += 1
+            self.sync_calls += int(sync)
+            self.queue_time += queue_time
+            self.max_queue_time = max(self.max_queue_time, queue_time)
+            self.run_time += run_time
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'sync_calls': self.sync_calls,
+                'queue_time': self.queue_time,
+                'max_queue_time': self.max_queue_time,
+                'mean_queue_time': self.queue_time / self.calls if self.calls else 0.0,
+                'run_time': self.run_time,
+            }
+
+
+class SyncHashingExecutor(IHashingExecutor):
+    """
+    Hashes on the calling thread.
+    """
+
+    def __init__(self):
+        self.metrics = HashingMetrics()
+
+    def run(self, func, *args, **kwargs):
+        started_at = time.time()
+        result = func(*args, **kwargs)
+        self.metrics.add(0.0, time.time() - started_at, sync=True)
+        return result
+
+
+class ProcessPoolHashingExecutor(IHashingExecutor):
+    """
+    Hashes in a pool of processes, so hashing doesn't hold the GIL of a web worker. The calling thread
+    waits for the result. If the pool can't be used, it hashes on the calling thread.
+
+    Functions and arguments are sent to the pool with pickle, so they must be defined at a module level.
+    """
+
+    def __init__(self, max_workers=None, max_concurrency=None):
+        """
+        Constructor.
+        :param max_workers: the number of processes, the number of CPUs by default
+        :param max_concurrency: how many hashes can wait for or run in the pool at once, other callers wait
+            for a free slot. It's twice as much as the number of processes by default.
+        """
+        self.max_workers = max_workers if max_workers is not None else multiprocessing.cpu_count()
+        self.max_concurrency = max_concurrency if max_concurrency is not None else self.max_workers * 2
+        self.metrics = HashingMetrics()
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def run(self, func, *args, **kwargs):
+        queued_at = time.time()
+
+        with self._slots:
+            pool = None
+            try:
+                pool = self._get_pool()
+                future = pool.submit(_call, func, args, kwargs)
+                result, error, started_at = future.result()
+            except Exception as e:
+                # the pool is broken, shut down or can't pickle the call, so don't let sign in fail because of it
+                logger.warning('Process pool hashing failed, hashing synchronously: %s', e)
+                # a broken pool raises BrokenProcessPool, a subclass of it, and a pool which has been shut down
+                # RuntimeError. A call which can't be pickled leaves the pool usable.
+                if isinstance(e, RuntimeError):
+                    self._reset_pool(pool)
+                started_at = time.time()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.metrics.add(started_at - queued_at, time.time() - started_at, sync=True)
+
+        self.metrics.add(started_at - queued_at, time.time() - started_at)
+
+        if error is not None:
+            raise error
+
+        return result
+
+    def shutdown(self, wait=True):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait)
+                self._pool = None
+
+    def _get_pool(self):
+        # the futures backport is needed only when hashing is offloaded
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.max_workers)
+            return self._pool
+
+    def _reset_pool(self, pool):
+        with self._pool_lock:
+            # other threads could have hit the same failure and replaced it already
+            if pool is None or pool is not self._pool:
+                return
+
+            self._pool = None
+            # don't leave its worker processes behind
+            pool.shutdown(wait=False)
+
+
+class OffloadedPasswordDelegate(object):
+    """
+    A password delegate proxy which calls the methods of a password delegate through a hashing executor.
+    Every call creates a new delegate instance where it's run.
+    """
+
+    def __init__(self, delegate_class, executor, attributes=None):
+        """
+        Constructor.
+        :param delegate_class: a password delegate class, such as sfkit.models.passwords.Pbkdf2Sha512PasswordDelegate
+        :param IHashingExecutor executor: an executor to run the delegate methods with
+        :param attributes: attributes to set on the delegate instances
+        """
+        self.delegate_class = delegate_class
+        self.executor = executor
+        self.attributes = attributes if attributes is not None else {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.delegate_class, name)
+
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self.executor.run(_call_delegate, self.delegate_class, self.attributes, name, args, kwargs)
+
+        call.__name__ = name
+        return call
+
+
+def measure_pbkdf2(iterations, samples=5):
+    """
+    Measure the median time of a PBKDF2-SHA512 hash with the number of iterations in seconds.
+    """
+    salt = os.urandom(16)
+    timings = []
+
+    for _ in range(samples):
+        started_at = time.time()
+        hashlib.pbkdf2_hmac('sha512', b'calibration password', salt, iterations)
+        timings.append(time.time() - started_at)
+
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def calibrate_pbkdf2_iterations(target=0.05, samples=5, minimum=10000):
+    """
+    Find the number of PBKDF2-SHA512 iterations which takes about target seconds on this machine.
+    :param target: a median hash time in seconds
+    :param samples: how many hashes are measured for every probe
+    :param minimum: the number of iterations is never lower than that
+    :return: a tuple (iterations, measured median time)
+    """
+    probe = minimum
+    elapsed = measure_pbkdf2(probe, samples)
+
+    # short probes are too noisy to extrapolate from
+    while elapsed < target / 10:
+        probe *= 2
+        elapsed = measure_pbkdf2(probe, samples)
+
+    iterations = max(minimum, int(probe * target / elapsed) // 1000 * 1000)
+    return iterations, measure_pbkdf2(iterations, samples)
+
+
+class Pbkdf2Policy(object):
+    """
+    A current cost of PBKDF2 password hashes.
+
+    It expects password delegates to take the number of iterations from an attribute and hashes to be
+    stored in the modular crypt format: $pbkdf2-sha512$<iterations>$<salt>$<checksum>.
+    """
+
+    def __init__(self, iterations, iterations_attribute='iterations'):
+        """
+        Constructor.
+        :param iterations: the current number of iterations
+        :param iterations_attribute: an attribute of password delegates which sets the number of iterations,
+            for example passlib handlers use rounds
+        """
+        self.iterations = iterations
+        self.iterations_attribute = iterations_attribute
+
+    def get_delegate_attributes(self):
+        """
+        Return attributes which make a password delegate hash with the policy parameters.
+        """
+        return {self.iterations_attribute: self.iterations}
+
+    def needs_rehash(self, hashed):
+        """
+        Check if a hash has been made with other parameters than the current ones.
+        Hashes of an unknown format are left as they are.
+        """
+        parts = hashed.split('$') if hashed else []
+
+        if len(parts) < 3 or not parts[1].startswith('pbkdf2'):
+            return False
+
+        try:
+            return int(parts[2]) != self.iterations
+        except ValueError:
+            return False
+
+    def init_app(self, app, command_name='calibrate-passwords'):
+        """
+        Register a command line command which finds the number of iterations for the machine.
+        """
+        app.cli.add_command(calibrate_command, command_name)
+
+
+@click.command('calibrate-passwords')
+@click.option('--target', type=float, default=0.05, help='A median hash time in seconds.')
+@click.option('--samples', type=int, default=5, help='How many hashes are measured for every probe.')
+def calibrate_command(target, samples):
+    """Find the number of PBKDF2 iterations for this machine."""
+    iterations, elapsed = calibrate_pbkdf2_iterations(target, samples)
+    click.echo('iterations: {} (median {:.1f}ms)'.format(iterations, elapsed * 1000))
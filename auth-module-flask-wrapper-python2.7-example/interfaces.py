@@ -1,5 +1,7 @@
 # coding: utf-8
 
+from .futures import submit
+
 
 class IStrategy(object):
     name = None
@@ -13,3 +15,9 @@ class IStrategyRegistryDataSource(object):
 class IFacebookLoader(object):
     def load(self, facebook_token):
         raise NotImplementedError()
+
+    def load_async(self, facebook_token):
+        """
+        Like load, but return a concurrent.futures.Future. By default load runs in the shared thread pool.
+        """
+        return submit(self.load, facebook_token)
@@ -11,6 +11,8 @@ from flask import (
 from flask.signals import Namespace
 from werkzeug.local import LocalProxy
 
+from .timing import timed
+
 _signals = Namespace()
 
 #: A proxy for the current user. If no user is logged in, this will be an
@@ -25,13 +27,21 @@ class LoginManager(object):
     one in the main body of your code and then bind it to your
     app in a factory function.
     """
-    def __init__(self, app=None):
+    def __init__(self, app=None, user_cache=None):
         #: A class or factory function that produces an anonymous user, which
         #: is used when no one is logged in.
         self.anonymous_user = AnonymousUserMixin
         self.user_callback = None
         self.unauthorized_callback = None
 
+        #: An optional cache of users by their ids, such as
+        #: :class:`sfkit.auth.cache.TTLCache`. It's shared between requests
+        #: and threads, so ORM users need :meth:`user_cacher` and
+        #: :meth:`user_reattacher` as well.
+        self.user_cache = user_cache
+        self.user_cache_callback = None
+        self.user_reattach_callback = None
+
         if app is not None:
             self.init_app(app)
 
@@ -48,6 +58,8 @@ class LoginManager(object):
         self._login_disabled = app.config.get('LOGIN_DISABLED',
                                               app.config.get('TESTING', False))
 
+        user_logged_out.connect(self._on_user_logged_out, sender=app)
+
     def unauthorized(self):
         """
         This is called when the user is required to log in. If you register a
@@ -73,6 +85,44 @@ class LoginManager(object):
         self.user_callback = callback
         return callback
 
+    def user_cacher(self, callback):
+        """
+        This sets the callback for turning a loaded user into the value which
+        is kept in the user cache. An ORM instance is expired by the next
+        commit and bound to the session of its request, so cache a detached
+        snapshot, such as :meth:`sfkit.auth.db.UserSnapshots.snapshot`.
+        By default the user object itself is cached.
+
+        :param callback: The callback for caching a user object.
+        :type callback: function
+        """
+        self.user_cache_callback = callback
+        return callback
+
+    def user_reattacher(self, callback):
+        """
+        This sets the callback for preparing a cached value for the current
+        request. The function you set should take a value made by the
+        :meth:`user_cacher` callback and return the user object to use, such
+        as :meth:`sfkit.auth.db.UserSnapshots.reattach`, which attaches it to
+        the current database session without a query.
+
+        :param callback: The callback for reattaching a user object.
+        :type callback: function
+        """
+        self.user_reattach_callback = callback
+        return callback
+
+    def invalidate_user(self, user_id):
+        """
+        Remove a user from the user cache, so it's loaded with the
+        :meth:`user_loader` callback next time. Call it when a user changes.
+
+        :param user_id: The ID of the user.
+        """
+        if self.user_cache is not None:
+            self.user_cache.delete(user_id)
+
     def unauthorized_handler(self, callback):
         """
         This will set the callback for the `unauthorized` method, which among
@@ -86,6 +136,7 @@ class LoginManager(object):
         self.unauthorized_callback = callback
         return callback
 
+    @timed('user_reload')
     def reload_user(self, user=None):
         ctx = _request_ctx_stack.top
 
@@ -94,7 +145,7 @@ class LoginManager(object):
             if user_id is None:
                 ctx.user = self.anonymous_user()
             else:
-                user = self.user_callback(user_id)
+                user = self._load_user_by_id(user_id)
                 if user is None:
                     logout_user()
                 else:
@@ -107,6 +158,29 @@ class LoginManager(object):
         user_accessed.send(current_app._get_current_object())
         return self.reload_user()
 
+    def _load_user_by_id(self, user_id):
+        """Loads user from the user cache or with the user callback"""
+        if self.user_cache is None:
+            return self.user_callback(user_id)
+
+        user = self.user_cache.get(user_id)
+
+        if user is None:
+            user = self.user_callback(user_id)
+            if user is not None:
+                cached = self.user_cache_callback(user) if self.user_cache_callback is not None else user
+                self.user_cache.set(user_id, cached)
+            return user
+
+        if self.user_reattach_callback is not None:
+            return self.user_reattach_callback(user)
+
+        return user
+
+    def _on_user_logged_out(self, sender, user=None, **kwargs):
+        if user is not None:
+            self.invalidate_user(user.id)
+
 
 class UserMixin(object):
     """
@@ -167,10 +241,13 @@ def logout_user():
     Logs a user out. (You do not need to pass the actual user.) This will
     also clean up the remember me cookie if it exists.
     """
+    # the user is loaded before the id is dropped, so the logged-out signal is sent
+    # even if the user hasn't been accessed during the request
+    user = _get_user()
+
     if 'user_id' in session:
         session.pop('user_id')
 
-    user = _get_user()
     if user and not user.is_anonymous():
         user_logged_out.send(current_app._get_current_object(), user=user)
 
@@ -0,0 +1,267 @@
+# coding: utf-8
+
+import json
+import logging
+from collections import namedtuple
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+
+import click
+from flask import request
+from sqlalchemy.exc import IntegrityError
+
+from .strategies import SimpleStrategy
+from ..errors import (
+    EmailAlreadyExists,
+    InvalidRegistrationData,
+    NoCredentialDataProvided,
+    RegistrationDeclined,
+)
+from ... import validation as val
+from ...errors import SFKitException
+from ...reqparser import six
+from ...views import View
+
+logger = logging.getLogger(__name__)
+
+#: A result of one record: its position in the input, its login, a registered user or an error
+BulkResult = namedtuple('BulkResult', ['index', 'login', 'user', 'error'])
+
+
+class BulkRegistration(object):
+    """
+    Register many users with logins and passwords at once.
+
+    Records are processed in chunks: every chunk is validated, checked for taken logins with a single
+    query, its passwords are hashed in parallel and its users are inserted in bulk.
+
+    The will_register and did_register hooks of a delegate, such as a registration view, are called
+    for every user.
+    """
+    strategy_class = SimpleStrategy
+
+    schema = val.Schema({
+        'login': val.Any(None, val.All(val.normalize(), val.email())),
+        'password': val.Any(None, val.All(six.text_type, val.Length(3))),
+    }, extra=True)
+
+    def __init__(self, db_delegate, chunk_size=500, workers=4, hashing_executor=None, password_policy=None,
+                 delegate=None):
+        """
+        Constructor.
+        :param sfkit.auth.registration.interfaces.IViewDbDelegate db_delegate: a database delegate instance
+        :param chunk_size: how many records are processed at once
+        :param workers: how many passwords are hashed at once, use a hashing executor to hash them
+            in other processes
+        :param sfkit.auth.hashing.IHashingExecutor hashing_executor: an executor to hash passwords with
+        :param sfkit.auth.hashing.Pbkdf2Policy password_policy: a policy to hash passwords with
+        :param delegate: an object with will_register(user) and did_register(user) methods
+        """
+        self.db_delegate = db_delegate
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.delegate = delegate
+
+        self.strategy = self.strategy_class(None, None)
+        self.strategy.hashing_executor = hashing_executor
+        self.strategy.password_policy = password_policy
+
+    def register(self, records):
+        """
+        Register users.
+        :param records: an iterable of dicts with login and password, other values are rejected
+            with InvalidRegistrationData
+        :return: a generator of BulkResult in the order of the records
+        """
+        records = iter(records)
+        offset = 0
+
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return
+
+            for result in self._register_chunk(offset, chunk):
+                yield result
+
+            offset += len(chunk)
+
+    def _register_chunk(self, offset, records):
+        results = []
+        accepted = {}
+
+        for index, record in enumerate(records, offset):
+            if not isinstance(record, dict):
+                results.append(BulkResult(index, None, None, InvalidRegistrationData()))
+                continue
+
+            try:
+                data = self.schema(record)
+            except val.Invalid:
+                results.append(BulkResult(index, record.get('login'), None, InvalidRegistrationData()))
+                continue
+
+            login = data.get('login')
+
+            if login is None or data.get('password') is None:
+                results.append(BulkResult(index, login, None, NoCredentialDataProvided()))
+            elif login in accepted:
+                results.append(BulkResult(index, login, None, EmailAlreadyExists()))
+            else:
+                accepted[login] = (index, data['password'])
+                results.append(None)
+
+        taken = self.db_delegate.find_existing_values('email', list(accepted)) if accepted else set()
+        users = []
+
+        for login in taken:
+            index, _ = accepted.pop(login)
+            results[index - offset] = BulkResult(index, login, None, EmailAlreadyExists())
+
+        for login, (index, password) in accepted.items():
+            user = self.db_delegate.get_empty()
+
+            if self.will_register(user):
+                users.append((index, login, password, user))
+            else:
+                results[index - offset] = BulkResult(index, login, None, RegistrationDeclined())
+
+        self._set_credentials(users)
+        self._save(users, results, offset)
+
+        for result in results:
+            if result.user is not None:
+                self.did_register(result.user)
+
+        return results
+
+    def will_register(self, user):
+        return self.delegate.will_register(user) if self.delegate is not None else True
+
+    def did_register(self, user):
+        if self.delegate is not None:
+            self.delegate.did_register(user)
+
+    def _set_credentials(self, users):
+        def set_credentials(item):
+            _, login, password, user = item
+            self.strategy.set_credentials(user, login, password)
+
+        if self.workers > 1 and len(users) > 1:
+            pool = ThreadPool(min(self.workers, len(users)))
+            try:
+                pool.map(set_credentials, users)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for item in users:
+                set_credentials(item)
+
+    def _save(self, users, results, offset):
+        try:
+            self.db_delegate.save_many([user for _, _, _, user in users])
+        except IntegrityError:
+            # someone could have taken a login since the check, or a user breaks another constraint,
+            # so save them one by one to find out which ones fail
+            self.db_delegate.rollback()
+
+            for index, login, _, user in users:
+                try:
+                    self.db_delegate.save(user)
+                except IntegrityError as e:
+                    self.db_delegate.rollback()
+                    results[index - offset] = BulkResult(index, login, None, self._get_save_error(login, e))
+                else:
+                    results[index - offset] = BulkResult(index, login, user, None)
+        else:
+            for index, login, _, user in users:
+                results[index - offset] = BulkResult(index, login, user, None)
+
+    def _get_save_error(self, login, error):
+        if login in self.db_delegate.find_existing_values('email', [login]):
+            return EmailAlreadyExists()
+
+        logger.warning('Failed to register %s: %s', login, error)
+        return InvalidRegistrationData()
+
+    def init_app(self, app, command_name='register-users'):
+        """
+        Register a command line command which registers users from a file of JSON lines, such as
+        {"login": "user@example.com", "password": "secret"}, and prints a JSON line for every record.
+        """
+        registration = self
+
+        @app.cli.command(command_name)
+        @click.argument('records', type=click.File('r'), default='-')
+        def register_users(records):
+            """Register users from a file of JSON lines."""
+            failed = 0
+
+            for result in registration.register(json.loads(line) for line in records if line.strip()):
+                failed += result.error is not None
+                click.echo(json.dumps({
+                    'index': result.index,
+                    'login': result.login,
+                    'error': result.error.namespace if result.error is not None else None,
+                }))
+
+            if failed:
+                raise SystemExit(1)
+
+
+class BulkRegistrationControllerView(View):
+    """
+    Registers users from a JSON body, such as {"users": [{"login": "user@example.com", "password": "secret"}]},
+    and responds with {"users": [{"index": 0, "login": "user@example.com", "error": null}]}.
+    The view is an admin tool, so protect it with a decorator of the application.
+    """
+    methods = ['POST']
+
+    error_exception = SFKitException
+    bulk_registration_class = BulkRegistration
+    max_records = 1000
+
+    def __init__(self, db_delegate):
+        """
+        :param sfkit.auth.registration.interfaces.IViewDbDelegate db_delegate: a database delegate instance
+        """
+        self.db_delegate = db_delegate
+
+    def post(self):
+        records = self.get_records()
+        registration = self.create_bulk_registration()
+
+        results = [{
+            'index': result.index,
+            'login': result.login,
+            'error': result.error.namespace if result.error is not None else None,
+        } for result in registration.register(records)]
+
+        return self.build_response({'users': results})
+
+    def get_records(self):
+        records = (request.get_json(silent=True) or {}).get('users')
+
+        if not isinstance(records, list) or len(records) > self.max_records or \
+                not all(isinstance(record, dict) for record in records):
+            self.error_handler(InvalidRegistrationData())
+
+        return records
+
+    def create_bulk_registration(self):
+        return self.bulk_registration_class(self.db_delegate, delegate=self)
+
+    def error_handler(self, error):
+        raise self.error_exception(error)
+
+    def will_register(self, user):
+        return True
+
+    def did_register(self, user):
+        pass
+
+    @classmethod
+    def register(cls, app, endpoint='signup_bulk', url="/signup/bulk/", view_args=None, view_kwargs=None,
+                 **kwargs):
+        super(BulkRegistrationControllerView, cls).register(app, url, endpoint, view_args, view_kwargs, **kwargs)
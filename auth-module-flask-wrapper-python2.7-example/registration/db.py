@@ -1,30 +1,56 @@
 # coding: utf-8
 
 from .interfaces import IViewDbDelegate
+from ..db import BakedFindByMixin
 
 
-class SAViewDbDelegate(IViewDbDelegate):
+class SAViewDbDelegate(BakedFindByMixin, IViewDbDelegate):
     db = None
     model = None
 
-    def __init__(self, db, model):
+    def __init__(self, db, model, load_only_fields=None):
+        """
+        :param load_only_fields: names of the columns to load, all by default
+        """
         self.db = db
         self.model = model
+        self.load_only_fields = tuple(load_only_fields) if load_only_fields else None
 
-    def find_by(self, **params):
-        criteria = []
+    def find_existing_fields(self, **params):
+        names = []
+        columns = []
 
         for k, v in params.iteritems():
-            field = getattr(self.model, k, None)
-            if field is not None:
-                criteria.append(field == v)
+            if getattr(self.model, k, None) is not None:
+                names.append(k)
+                columns.append(self.db.exists().where(self._get_field_expression(k) == self._get_field_value(k, v)))
 
-        if criteria:
-            return self.db.session.query(self.model).filter(self.db.or_(*criteria)).first()
+        if not columns:
+            return set()
+
+        # a single SELECT EXISTS(...), EXISTS(...) without loading any rows
+        row = self.db.session.query(*columns).one()
+        return set(name for name, exists in zip(names, row) if exists)
+
+    def find_existing_values(self, field, values):
+        expression = self._get_field_expression(field)
+        normalized = dict((self._get_field_value(field, v), v) for v in values)
+
+        rows = self.db.session.query(expression).filter(expression.in_(list(normalized)))
+        return set(normalized[row[0]] for row in rows if row[0] in normalized)
 
     def save(self, user):
         self.db.session.add(user)
         self.db.session.commit()
 
+    def save_many(self, users):
+        # unlike bulk_save_objects, the users get their primary keys and stay in the session,
+        # as the ones saved with save do
+        self.db.session.add_all(users)
+        self.db.session.commit()
+
+    def rollback(self):
+        self.db.session.rollback()
+
     def get_empty(self):
         return self.model()
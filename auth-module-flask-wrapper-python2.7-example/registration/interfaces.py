@@ -32,6 +32,32 @@ class IViewDbDelegate(object):
     def find_by(self, **params):
         raise NotImplementedError()
 
+    def save_many(self, users):
+        """
+        Save several users in one transaction. Saved users must have their primary keys set, like
+        the ones saved with save.
+        """
+        raise NotImplementedError()
+
+    def rollback(self):
+        raise NotImplementedError()
+
+    def find_existing_values(self, field, values):
+        """
+        Check which values of a field are already taken. Delegates which can check them with one query
+        should override it.
+        :return: a set of the taken values
+        """
+        return set(value for value in values if self.find_by(**{field: value}) is not None)
+
+    def find_existing_fields(self, **params):
+        """
+        Check which of the field values are already taken. Delegates which can check them with one query
+        should override it.
+        :return: a set of the taken field names
+        """
+        return set(k for k, v in params.items() if self.find_by(**{k: v}) is not None)
+
 
 class IStrategyDataSource(object):
     def get_registration_data(self):
@@ -42,6 +68,13 @@ class IUniqueCheckDelegate(object):
     def check(self, **params):
         raise NotImplementedError()
 
+    def find_collisions(self, **params):
+        """
+        Check the uniqueness of several fields at once.
+        :return: a set of the field names which values are already taken
+        """
+        return set(k for k, v in params.items() if self.check(**{k: v}))
+
 
 class IStrategyDelegate(object):
     def will_user_save(self, strategy, user, *args, **kwargs):
@@ -9,12 +9,16 @@ from ..errors import (
     NoCredentialDataProvided,
 )
 from ..facebook_loader import FacebookSDKLoader
+from ..hashing import create_password_delegate
+from ..interfaces import IFacebookLoader
 from ...models import passwords
 
 
 class SimpleStrategy(IRegistrationStrategy):
     name = 'simple'
     password_delegate = passwords.Pbkdf2Sha512PasswordDelegate
+    hashing_executor = None  # sfkit.auth.hashing.IHashingExecutor
+    password_policy = None  # sfkit.auth.hashing.Pbkdf2Policy
 
     def register(self, user, error_callback=None):
         data = self.data_source.get_registration_data()
@@ -30,12 +34,15 @@ class SimpleStrategy(IRegistrationStrategy):
             error_callback(EmailAlreadyExists())
             return
 
+        self.set_credentials(user, login, password)
+
+    def set_credentials(self, user, login, password):
         user.password_delegate = self.create_password_delegate()
         user.email = login
         user.password = password
 
     def create_password_delegate(self):
-        return self.password_delegate()
+        return create_password_delegate(self.password_delegate, self.hashing_executor, self.password_policy)
 
 
 class FacebookStrategy(SimpleStrategy):
@@ -61,17 +68,32 @@ class FacebookStrategy(SimpleStrategy):
             return
 
         facebook_id = faccount['id']
+        login = data.get('login')
+        password = data.get('password')
+        fields = {'facebook_id': facebook_id}
+
+        if not self.user_simple_registration:
+            fields['email'] = data['email']
+        elif login is not None and password is not None:
+            fields['email'] = login
 
-        if self.unique_check_delegate.check(facebook_id=facebook_id):
+        # check all the unique fields with a single query
+        collisions = self.unique_check_delegate.find_collisions(**fields)
+
+        if 'facebook_id' in collisions:
             error_callback(FacebookAlreadyExists())
             return
 
+        if 'email' not in fields:
+            error_callback(NoCredentialDataProvided())
+            return
+
+        if 'email' in collisions:
+            error_callback(EmailAlreadyExists())
+            return
+
         if self.user_simple_registration:
-            super(FacebookStrategy, self).register(user, error_callback)
-        else:
-            if self.unique_check_delegate.check(email=data['email']):
-                error_callback(EmailAlreadyExists())
-                return
+            self.set_credentials(user, login, password)
 
         user.facebook_id = facebook_id
         user.email = data['email']
@@ -80,5 +102,12 @@ class FacebookStrategy(SimpleStrategy):
         # return self.save(new_user, faccount=faccount)
 
     def get_facebook_account(self, facebook_token):
-        fb_loader = self.facebook_loader()
+        fb_loader = self.create_facebook_loader()
         return fb_loader.load(facebook_token)
+
+    def create_facebook_loader(self):
+        # a loader instance, such as a shared cache, is used as is
+        if isinstance(self.facebook_loader, IFacebookLoader):
+            return self.facebook_loader
+
+        return self.facebook_loader()
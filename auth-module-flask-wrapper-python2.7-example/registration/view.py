@@ -6,18 +6,19 @@ from .strategies import (
     SimpleStrategy,
 )
 from .. import StrategyRegistry
+from ..controllers import (
+    StrategyControllerMixin,
+    create_request_parser,
+)
 from ..interfaces import IStrategyRegistryDataSource
 from ..errors import StrategyNotDefined
 from ... import validation as val
 from ...errors import SFKitException
-from ...reqparser import (
-    RequestParser,
-    six
-)
+from ...reqparser import six
 from ...views import View
 
 
-class RegistrationControllerView(IStrategyRegistryDataSource, IUniqueCheckDelegate, View):
+class RegistrationControllerView(StrategyControllerMixin, IStrategyRegistryDataSource, IUniqueCheckDelegate, View):
     methods = ['POST']
 
     error_exception = SFKitException
@@ -27,14 +28,20 @@ class RegistrationControllerView(IStrategyRegistryDataSource, IUniqueCheckDelega
     ]
     strategy_registry_class = StrategyRegistry
 
+    request_parser = create_request_parser('type', 'facebook_token', 'login', 'password', 'email')
+    registration_schema = val.Schema({
+        val.Optional('facebook_token'): val.Any(None, six.text_type),
+        val.Optional('login'): val.Any(None, val.All(val.normalize(), val.email())),
+        val.Optional('password'): val.Any(None, val.All(six.text_type, val.Length(3))),
+        val.Optional('email'): val.All(val.email(), val.normalize()),
+    }, extra=True)
+
     def __init__(self, db_delegate):
         """
         :param sfkit.auth.registration.interfaces.IViewDbDelegate db_delegate: a database delegate instance
         """
         self.db_delegate = db_delegate
-
-        self.strategy_registry = self._create_strategy_registry()
-        self._add_strategies(self.strategy_registry)
+        self.strategy_registry = self._bind_strategy_registry()
 
     def post(self):
         self.apply_strategy(self.strategy_registry.find())
@@ -53,26 +60,10 @@ class RegistrationControllerView(IStrategyRegistryDataSource, IUniqueCheckDelega
             self.did_register(new_user)
 
     def get_type_name(self):
-        parser = RequestParser()
-        parser.add_argument('type')
-        args = parser.parse_args()
-        return args['type']
+        return self.get_request_args()['type']
 
     def get_registration_data(self):
-        parser = RequestParser()
-        parser.add_argument('facebook_token')
-        parser.add_argument('login')
-        parser.add_argument('password')
-        parser.add_argument('email')
-
-        schema = val.Schema({
-            val.Optional('facebook_token'): val.Any(None, six.text_type),
-            val.Optional('login'): val.Any(None, val.All(val.normalize(), val.email())),
-            val.Optional('password'): val.Any(None, val.All(six.text_type, val.Length(3))),
-            val.Optional('email'): val.All(val.email(), val.normalize()),
-        }, extra=True)
-
-        return schema(parser.parse_args())
+        return self.registration_schema(self.get_request_args())
 
     def error_handler(self, error):
         raise self.error_exception(error)
@@ -86,21 +77,11 @@ class RegistrationControllerView(IStrategyRegistryDataSource, IUniqueCheckDelega
     def did_register(self, user):
         pass
 
-    def _create_strategy_registry(self):
-        """
-        :return: a strategy registry
-        :rtype sfkit.auth.StrategyRegistry
-        """
-        return self.strategy_registry_class(self)
-
-    def _add_strategies(self, strategy_registry):
-        for strategy_class in self.strategies:
-            strategy = strategy_class(self, self)
-            strategy.delegate = self
-            strategy_registry.add(strategy)
-
     def check(self, **params):
-        return self.db_delegate.find_by(**params) is not None
+        return bool(self.find_collisions(**params))
+
+    def find_collisions(self, **params):
+        return self.db_delegate.find_existing_fields(**params)
 
     @classmethod
     def register(cls, app, endpoint='signup', url="/signup/", view_args=None, view_kwargs=None, **kwargs):
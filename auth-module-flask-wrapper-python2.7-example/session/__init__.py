@@ -1,5 +1,7 @@
 # coding: utf-8
 
+import hashlib
+import json
 import uuid
 
 from flask.sessions import (
@@ -8,26 +10,121 @@ from flask.sessions import (
 )
 
 
+def session_digest(data):
+    """
+    Calculate a digest of session contents which doesn't depend on the key order.
+    :param data: a session dict
+    """
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=repr)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
 class SecureKeySession(SecureCookieSession):
-    def __init__(self, initial=None, key=None):
+    #: whether the session data has been loaded from a backend
+    loaded = True
+
+    def __init__(self, initial=None, key=None, key_factory=None):
         SecureCookieSession.__init__(self, initial)
         self.key = key
+        self.key_factory = key_factory
+        # a digest of the loaded contents and the time the session was touched last
+        self.digest = None
+        self.touched_at = None
+        # whether the session exists in the backend, then it's only updated
+        self.stored = False
 
     def generate_new(self, new_id=None):
         """
-        Create a new session. If the new_id is not set it's automaticaly generated.
+        Create a new session. If the new_id is not set it's generated by the key factory
+        or it's a random one.
         :param new_id: a new session id
+        :return: the new session id
         """
+        if new_id is None and self.key_factory is not None:
+            new_id = self.key_factory(self)
+
         self.key = str(uuid.uuid4()) if new_id is None else new_id
+        self.digest = None
+        self.stored = False
         self.modified = True
+        return self.key
+
+
+class LazySecureKeySession(SecureKeySession):
+    """
+    A session which loads its data from a backend on the first access to it.
+    If there is no such session in the backend, the key is reset.
+
+    On Python 2 dict(session), json.dumps(session) and other C code read the dict storage directly
+    and don't trigger loading, so they see an unloaded session as empty. Call load() before them.
+    """
+    loaded = False
+
+    def __init__(self, loader, key=None, key_factory=None):
+        """
+        Constructor.
+        :param loader: a callable which takes a key and returns a tuple (data, touched_at)
+        """
+        SecureKeySession.__init__(self, key=key, key_factory=key_factory)
+        self.loader = loader
+
+    def load(self):
+        if self.loaded:
+            return
+
+        # if the loader fails, the session stays unloaded and isn't saved over the stored one
+        data, touched_at = self.loader(self.key)
+        self.loaded = True
+
+        if data is None:
+            self.key = None
+            return
+
+        # bypass the update callback, loading doesn't modify the session
+        dict.update(self, data)
+        self.digest = session_digest(data)
+        self.touched_at = touched_at
+        self.stored = True
+
+    def generate_new(self, new_id=None):
+        self.load()
+        return SecureKeySession.generate_new(self, new_id)
+
+
+def _loading(method):
+    def wrapper(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for _name in ('__getitem__', '__setitem__', '__delitem__', '__contains__', '__iter__', '__len__', '__eq__',
+              '__ne__', '__repr__', 'get', 'setdefault', 'pop', 'popitem', 'update', 'clear', 'copy', 'keys',
+              'values', 'items', 'has_key', 'iterkeys', 'itervalues', 'iteritems', 'viewkeys', 'viewvalues',
+              'viewitems'):
+    if hasattr(SecureKeySession, _name):
+        setattr(LazySecureKeySession, _name, _loading(getattr(SecureKeySession, _name)))
+
+del _name
 
 
 class CommonSessionInterface(SessionInterface):
     session_class = SecureKeySession
+    lazy_session_class = LazySecureKeySession
 
-    def __init__(self, backend, source):
+    def __init__(self, backend, source, lazy=False):
+        """
+        Constructor.
+        :param sfkit.auth.session.interfaces.ISessionBackend backend: a session backend
+        :param sfkit.auth.session.interfaces.ISessionSource source: a source of session ids
+        :param lazy: load a session from the backend only when it's accessed
+        """
         self.backend = backend
         self.source = source
+        self.lazy = lazy
 
     def open_session(self, app, request):
         if not app.secret_key:
@@ -35,22 +132,41 @@ class CommonSessionInterface(SessionInterface):
 
         sid = self.source.get_session_id()
 
+        if sid is not None and self.lazy:
+            return self.lazy_session_class(self.backend.load_session, key=sid, key_factory=self.backend.generate_key)
+
         if sid is not None:
-            data = self.backend.get_session_data(sid)
+            data, touched_at = self.backend.load_session(sid)
 
             if data is not None:
-                return self.session_class(data, key=sid)
+                session = self.session_class(data, key=sid, key_factory=self.backend.generate_key)
+                session.digest = session_digest(data)
+                session.touched_at = touched_at
+                session.stored = True
+                return session
 
-        return self.session_class()
+        return self.session_class(key_factory=self.backend.generate_key)
 
     def save_session(self, app, session, response):
-        if session.key is not None and session.modified:
+        # a lazy session which has never been loaded has nothing to save
+        if not session.loaded or session.key is None or not session.modified:
+            return
+
+        # skip the write if nothing has changed and the expiration doesn't have to be refreshed yet
+        if session.digest is not None and session.digest == session_digest(session) and \
+                not self.backend.is_touch_due(session.touched_at):
+            return
+
+        # a stored session could have been revoked during the request, so it mustn't be created again
+        if session.stored:
+            self.backend.update_session_data(session.key, session)
+        else:
             self.backend.save_session_data(session.key, session)
 
 
 class SessionExtension(object):
-    def __init__(self, backend, source, app=None):
-        self.session_interface = CommonSessionInterface(backend, source)
+    def __init__(self, backend, source, app=None, lazy=False):
+        self.session_interface = CommonSessionInterface(backend, source, lazy=lazy)
 
         if app is not None:
             self.init_app(app)
@@ -7,7 +7,24 @@ from datetime import (
     timedelta,
 )
 
+from sqlalchemy import (
+    and_,
+    case,
+    literal_column,
+    select,
+)
+from sqlalchemy.dialects import (
+    postgresql,
+    sqlite,
+)
+
 from .interfaces import ISessionBackend
+from ..cache import TTLCache
+from ..futures import (
+    completed,
+    submit,
+)
+from ..timing import timed
 from .signals import (
     on_after_create,
     on_after_update,
@@ -22,7 +39,8 @@ class SQLAlchemySessionBackend(ISessionBackend):
     A session backend based on sqlalchemy ORM.
     """
 
-    def __init__(self, db_session, session_table, expiration=30):
+    def __init__(self, db_session, session_table, expiration=30, touch_fraction=0.01, codec=None,
+                 user_id_column=None):
         """
         Constructor. A session table should have three fields:
         * session_id,
@@ -31,60 +49,243 @@ class SQLAlchemySessionBackend(ISessionBackend):
         :param db_session: an sqlalchemy session
         :param session_table: an sqlalchemy model sfkit.models.sa.SessionModelMixin
         :param expiration: when the session will be expired in days
+        :param touch_fraction: which part of the expiration period should pass before expiration_date is
+            refreshed again, 0 refreshes it on every save
+        :param sfkit.auth.session.interfaces.ISessionCodec codec: a codec to store session_data with,
+            the session_data column should be a binary one then. If it's not set, a dict is stored as is.
+        :param user_id_column: a name of an indexed nullable column which the user id of a session is copied
+            to on every save. It's required by revoke_user_sessions.
         """
         self.db_session = db_session
         self.session_table = session_table
         self.expiration = expiration
+        self.touch_fraction = touch_fraction
+        self.codec = codec
+        self.user_id_column = user_id_column
 
     def get_session_data(self, session_id):
+        return self.load_session(session_id)[0]
+
+    @timed('session_load')
+    def load_session(self, session_id):
         table = self.session_table
         time_diff = datetime.utcnow() - timedelta(days=self.expiration)
 
         # load nonexpired session
-        row = self.db_session.query(table.session_data).filter(
+        row = self.db_session.query(table.session_data, table.expiration_date).filter(
             table.session_id == session_id, table.expiration_date >= time_diff).first()
 
         on_get.send(current_app._get_current_object(),
                     backend=self,
                     session=row)
 
-        return row.session_data if row is not None else row
+        if row is None:
+            return None, None
+
+        return self.decode(row.session_data), row.expiration_date
+
+    def is_touch_due(self, touched_at):
+        if touched_at is None:
+            return True
+
+        return datetime.utcnow() - touched_at >= self._touch_interval()
+
+    def encode(self, data):
+        return self.codec.encode(data) if self.codec is not None else data
+
+    def decode(self, value):
+        return self.codec.decode(value) if self.codec is not None else value
+
+    def _touch_interval(self):
+        return timedelta(seconds=self.expiration * 24 * 60 * 60 * self.touch_fraction)
+
+    def _get_user_columns(self, data):
+        if self.user_id_column is None:
+            return {}
+
+        return {self.user_id_column: data.get(self.user_id_key)}
+
+    def revoke_user_sessions(self, user_id):
+        if self.user_id_column is None:
+            raise RuntimeError('revoke_user_sessions requires the user_id_column')
+
+        table = self.session_table
+        deleted = self.db_session.query(table).filter(
+            getattr(table, self.user_id_column) == user_id).delete(synchronize_session=False)
+        self.db_session.commit()
+        return deleted
 
     def save_session_data(self, session_id, data):
-        print(session_id)
+        return self.save_many_session_data([(session_id, data)])[0]
+
+    def copy_session_data(self, session_id, data, touched_at):
+        table = self.session_table
+
+        if self.db_session.query(table.session_id).filter(table.session_id == session_id).first() is not None:
+            return False
+
+        self.db_session.add(table(session_id=session_id,
+                                  session_data=self.encode(dict(data)),
+                                  expiration_date=touched_at if touched_at is not None else datetime.utcnow(),
+                                  **self._get_user_columns(data)))
+
+        try:
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+
+        return True
+
+    def update_session_data(self, session_id, data):
+        return self.update_many_session_data([(session_id, data)])[0]
+
+    def save_many_session_data(self, items):
+        return self._save_many(items, create=True)
+
+    def update_many_session_data(self, items):
+        return self._save_many(items, create=False)
+
+    @timed('session_save')
+    def _save_many(self, items, create):
         db_session = self.db_session
         table = self.session_table
         now = datetime.utcnow()
 
-        session_row = db_session.query(table).get(session_id)
-        session_data = dict(data)
-        is_new = False
+        if len(items) == 1:
+            session_id = items[0][0]
+            session_rows = {session_id: db_session.query(table).get(session_id)}
+        else:
+            session_ids = [session_id for session_id, _ in items]
+            session_rows = dict((row.session_id, row)
+                                for row in db_session.query(table).filter(table.session_id.in_(session_ids)))
 
-        if not session_row:
-            # create a new session
-            is_new = True
+        saved = []
+        results = []
 
-            session_row = table(session_id=session_id, session_data=session_data, expiration_date=now)
-            on_after_create.send(current_app._get_current_object(),
-                                 backend=self,
-                                 session=session_row,
-                                 is_new=is_new)
+        for session_id, data in items:
+            session_row = session_rows.get(session_id)
 
-            db_session.add(session_row)
-        else:
-            # or update the current one
-            session_row.session_data = session_data
+            if not session_row and not create:
+                # it has been deleted since it was loaded
+                results.append(None)
+                continue
+
+            session_data = self.encode(dict(data))
+            user_columns = self._get_user_columns(data)
+            is_new = False
+
+            if not session_row:
+                # create a new session
+                is_new = True
+
+                session_row = table(session_id=session_id, session_data=session_data, expiration_date=now,
+                                    **user_columns)
+                on_after_create.send(current_app._get_current_object(),
+                                     backend=self,
+                                     session=session_row,
+                                     is_new=is_new)
+
+                db_session.add(session_row)
+                session_rows[session_id] = session_row
+            else:
+                # or update the current one
+                session_row.session_data = session_data
+                for name, value in user_columns.items():
+                    setattr(session_row, name, value)
+
+                # check expiration date and update if it's not expired and it's time to touch it
+                if session_row.expiration_date >= (now - timedelta(days=self.expiration)) and \
+                        self.is_touch_due(session_row.expiration_date):
+                    session_row.expiration_date = now
 
-            # check expiration date and update if it's not expired
-            if session_row.expiration_date >= (now - timedelta(days=self.expiration)):
-                session_row.expiration_date = now
+                on_after_update.send(current_app._get_current_object(),
+                                     backend=self,
+                                     session=session_row,
+                                     is_new=is_new)
 
-            on_after_update.send(current_app._get_current_object(),
-                                 backend=self,
-                                 session=session_row,
-                                 is_new=is_new)
+            saved.append((session_row, is_new))
+            results.append(session_row)
 
-        db_session.flush()
+        try:
+            db_session.flush()
+
+            for session_row, is_new in saved:
+                on_before_save.send(current_app._get_current_object(),
+                                    backend=self,
+                                    session=session_row,
+                                    is_new=is_new)
+
+            db_session.commit()
+        except Exception:
+            # leave the session usable, callers such as AsyncSessionWriter retry with it
+            db_session.rollback()
+            raise
+
+        for session_row, is_new in saved:
+            on_after_save.send(current_app._get_current_object(),
+                               backend=self,
+                               session=session_row,
+                               is_new=is_new)
+
+        return [session_row.expiration_date if session_row is not None else None for session_row in results]
+
+
+class SQLAlchemyUpsertSessionBackend(SQLAlchemySessionBackend):
+    """
+    A session backend which saves a session with a single INSERT ... ON CONFLICT DO UPDATE statement.
+    It works with PostgreSQL and SQLite only.
+
+    The signals get a transient session row, changing it in a signal handler doesn't change the saved session.
+    Updates of stored sessions are a single UPDATE ... RETURNING statement on PostgreSQL. On SQLite, the
+    refreshed expiration date is read back with a SELECT in the same transaction.
+    """
+
+    def save_session_data(self, session_id, data):
+        return self._save(session_id, data, create=True)
+
+    def update_session_data(self, session_id, data):
+        return self._save(session_id, data, create=False)
+
+    @timed('session_save')
+    def _save(self, session_id, data, create):
+        db_session = self.db_session
+        table = self.session_table.__table__
+        now = datetime.utcnow()
+        session_data = self.encode(dict(data))
+        user_columns = self._get_user_columns(data)
+        dialect = db_session.get_bind().dialect.name
+
+        # refresh expiration date only if it's not expired and it's time to touch it
+        expiration_date = case([
+            (and_(table.c.expiration_date >= now - timedelta(days=self.expiration),
+                  table.c.expiration_date <= now - self._touch_interval()), now)
+        ], else_=table.c.expiration_date)
+
+        if not create:
+            is_new = False
+            touched_at = self._update(table, session_id, session_data, user_columns, expiration_date, dialect)
+
+            if touched_at is None:
+                # it has been deleted since it was loaded
+                db_session.commit()
+                return None
+        elif dialect == 'postgresql':
+            is_new, touched_at = self._upsert_postgresql(table, session_id, session_data, user_columns,
+                                                         expiration_date, now)
+        elif dialect == 'sqlite':
+            is_new, touched_at = self._upsert_sqlite(table, session_id, session_data, user_columns,
+                                                     expiration_date, now)
+        else:
+            raise NotImplementedError('Upsert is not supported by the {} dialect'.format(dialect))
+
+        session_row = self.session_table(session_id=session_id, session_data=session_data,
+                                         expiration_date=touched_at, **user_columns)
+        signal = on_after_create if is_new else on_after_update
+        signal.send(current_app._get_current_object(),
+                    backend=self,
+                    session=session_row,
+                    is_new=is_new)
 
         on_before_save.send(current_app._get_current_object(),
                             backend=self,
@@ -97,3 +298,164 @@ class SQLAlchemySessionBackend(ISessionBackend):
                            backend=self,
                            session=session_row,
                            is_new=is_new)
+
+        return touched_at
+
+    def save_many_session_data(self, items):
+        return [self.save_session_data(session_id, data) for session_id, data in items]
+
+    def update_many_session_data(self, items):
+        return [self.update_session_data(session_id, data) for session_id, data in items]
+
+    def _upsert_postgresql(self, table, session_id, session_data, user_columns, expiration_date, now):
+        stmt = postgresql.insert(table).values(session_id=session_id,
+                                               session_data=session_data,
+                                               expiration_date=now,
+                                               **user_columns)
+        set_ = {'session_data': stmt.excluded.session_data, 'expiration_date': expiration_date}
+        set_.update((name, stmt.excluded[name]) for name in user_columns)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.session_id],
+            set_=set_
+        ).returning(table.c.expiration_date, literal_column('(xmax = 0)').label('inserted'))
+
+        row = self.db_session.execute(stmt).first()
+        return row.inserted, row.expiration_date
+
+    def _upsert_sqlite(self, table, session_id, session_data, user_columns, expiration_date, now):
+        # sqlite can't tell if the row was inserted from an upsert, so the insert is tried first.
+        # Both statements run in the same transaction and sqlite locks the database for writing,
+        # so it's still atomic.
+        stmt = sqlite.insert(table).values(session_id=session_id,
+                                           session_data=session_data,
+                                           expiration_date=now,
+                                           **user_columns)
+        result = self.db_session.execute(stmt.on_conflict_do_nothing(index_elements=[table.c.session_id]))
+
+        if result.rowcount:
+            return True, now
+
+        return False, self._update(table, session_id, session_data, user_columns, expiration_date, 'sqlite')
+
+    def _update(self, table, session_id, session_data, user_columns, expiration_date, dialect):
+        stmt = table.update().where(table.c.session_id == session_id).values(
+            session_data=session_data, expiration_date=expiration_date, **user_columns)
+
+        if dialect == 'postgresql':
+            # no row comes back if the session has been deleted
+            return self.db_session.execute(stmt.returning(table.c.expiration_date)).scalar()
+
+        result = self.db_session.execute(stmt)
+
+        if not result.rowcount:
+            return None
+
+        # read the refreshed expiration date back within the same transaction
+        return self.db_session.execute(
+            select([table.c.expiration_date]).where(table.c.session_id == session_id)).scalar()
+
+
+class CachedSessionBackend(ISessionBackend):
+    """
+    A read-through cache in front of another session backend.
+
+    The cache lives in the process memory, so a session changed by another process can be served
+    stale until its entry expires. Keep the ttl short. Cache hits don't send the on_get signal.
+    """
+    _missing = object()
+
+    def __init__(self, backend, maxsize=10000, ttl=10):
+        """
+        Constructor.
+        :param sfkit.auth.session.interfaces.ISessionBackend backend: a backend to wrap
+        :param maxsize: how many sessions to keep, the least recently used ones are evicted first
+        :param ttl: how long a session is cached in seconds
+        """
+        self.backend = backend
+        self.cache = TTLCache(maxsize, ttl)
+
+    @property
+    def hits(self):
+        return self.cache.hits
+
+    @property
+    def misses(self):
+        return self.cache.misses
+
+    def get_session_data(self, session_id):
+        return self.load_session(session_id)[0]
+
+    def load_session(self, session_id):
+        entry = self.cache.get(session_id, self._missing)
+
+        if entry is self._missing:
+            return self._load_from_backend(session_id)
+
+        data, touched_at = entry
+        return dict(data), touched_at
+
+    def get_session_data_async(self, session_id):
+        # cache hits don't need a thread
+        entry = self.cache.get(session_id, self._missing)
+        if entry is not self._missing:
+            return completed(dict(entry[0]))
+
+        return submit(lambda: self._load_from_backend(session_id)[0])
+
+    def _load_from_backend(self, session_id):
+        data, touched_at = self.backend.load_session(session_id)
+        if data is not None:
+            self.cache.set(session_id, (dict(data), touched_at))
+        return data, touched_at
+
+    def save_session_data(self, session_id, data):
+        # drop the entry first, so a failed save doesn't leave a stale one behind
+        self.cache.delete(session_id)
+        touched_at = self.backend.save_session_data(session_id, data)
+        self.cache.set(session_id, (dict(data), touched_at))
+        return touched_at
+
+    def update_session_data(self, session_id, data):
+        return self.update_many_session_data([(session_id, data)])[0]
+
+    def copy_session_data(self, session_id, data, touched_at):
+        self.cache.delete(session_id)
+        return self.backend.copy_session_data(session_id, data, touched_at)
+
+    def save_many_session_data(self, items):
+        for session_id, _ in items:
+            self.cache.delete(session_id)
+
+        touched = self.backend.save_many_session_data(items)
+
+        for (session_id, data), touched_at in zip(items, touched):
+            self.cache.set(session_id, (dict(data), touched_at))
+
+        return touched
+
+    def update_many_session_data(self, items):
+        for session_id, _ in items:
+            self.cache.delete(session_id)
+
+        touched = self.backend.update_many_session_data(items)
+
+        for (session_id, data), touched_at in zip(items, touched):
+            # None means the session is gone or the backend doesn't know, so don't cache it either way
+            if touched_at is not None:
+                self.cache.set(session_id, (dict(data), touched_at))
+
+        return touched
+
+    def is_touch_due(self, touched_at):
+        return self.backend.is_touch_due(touched_at)
+
+    def generate_key(self, session):
+        return self.backend.generate_key(session)
+
+    def revoke_user_sessions(self, user_id):
+        deleted = self.backend.revoke_user_sessions(user_id)
+        self.cache.delete_matching(lambda session_id, entry: entry[0].get(self.user_id_key) == user_id)
+        return deleted
+
+    def invalidate(self, session_id):
+        self.cache.delete(session_id)
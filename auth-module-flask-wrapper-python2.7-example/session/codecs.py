@@ -0,0 +1,135 @@
+# coding: utf-8
+
+import json
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+from .interfaces import ISessionCodec
+
+#: a flag of the header byte which marks zlib compressed payloads
+COMPRESSED = 0x80
+
+_codecs = {}
+
+
+def register_codec(codec_class):
+    """
+    Register a codec class, so its values can be decoded by any codec.
+    """
+    _codecs[codec_class.format_id] = codec_class
+    return codec_class
+
+
+def decode_session_data(value):
+    """
+    Decode session data encoded by any registered codec. Legacy values which were stored
+    as a dict or as a JSON string are returned as is or parsed.
+    :param value: a stored value
+    :return: a session dict
+    """
+    if value is None or isinstance(value, dict):
+        return value
+
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+
+    if not isinstance(value, bytes):
+        # a legacy JSON text
+        return json.loads(value)
+
+    header = struct.unpack('B', value[:1])[0]
+    codec_class = _codecs.get(header & ~COMPRESSED)
+
+    if codec_class is None:
+        # a legacy JSON text stored as bytes
+        return json.loads(value.decode('utf-8'))
+
+    payload = value[1:]
+    if header & COMPRESSED:
+        payload = zlib.decompress(payload)
+
+    return codec_class.loads(payload)
+
+
+class SessionCodec(ISessionCodec):
+    """
+    A base versioned codec. An encoded value is one header byte, which holds the format id and
+    the compression flag, followed by the payload.
+    """
+    format_id = None
+
+    def __init__(self, compress_threshold=512, compress_level=6):
+        """
+        Constructor.
+        :param compress_threshold: payloads of this size in bytes and bigger are compressed with zlib,
+            None turns compression off
+        :param compress_level: a zlib compression level
+        """
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, data):
+        payload = self.dumps(dict(data))
+        header = self.format_id
+
+        if self.compress_threshold is not None and len(payload) >= self.compress_threshold:
+            compressed = zlib.compress(payload, self.compress_level)
+            if len(compressed) < len(payload):
+                payload = compressed
+                header |= COMPRESSED
+
+        return struct.pack('B', header) + payload
+
+    def decode(self, value):
+        return decode_session_data(value)
+
+    @staticmethod
+    def dumps(data):
+        raise NotImplementedError()
+
+    @staticmethod
+    def loads(payload):
+        raise NotImplementedError()
+
+
+@register_codec
+class JSONCodec(SessionCodec):
+    """
+    Compact JSON.
+    """
+    format_id = 0x01
+
+    @staticmethod
+    def dumps(data):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def loads(payload):
+        return json.loads(payload.decode('utf-8'))
+
+
+@register_codec
+class MsgpackCodec(SessionCodec):
+    """
+    MessagePack. It requires the msgpack package.
+    """
+    format_id = 0x02
+
+    def __init__(self, *args, **kwargs):
+        if msgpack is None:
+            raise RuntimeError('MsgpackCodec requires the msgpack package')
+
+        super(MsgpackCodec, self).__init__(*args, **kwargs)
+
+    @staticmethod
+    def dumps(data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    @staticmethod
+    def loads(payload):
+        return msgpack.unpackb(payload, raw=False)
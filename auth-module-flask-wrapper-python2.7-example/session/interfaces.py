@@ -1,5 +1,7 @@
 # coding: utf-8
 
+from ..futures import submit
+
 
 class ISessionSource(object):
     """
@@ -18,6 +20,8 @@ class ISessionBackend(object):
     """
     How to manage session data
     """
+    #: a session data key which holds the id of a signed in user
+    user_id_key = 'user_id'
 
     def get_session_data(self, session_id):
         """
@@ -28,10 +32,139 @@ class ISessionBackend(object):
         """
         raise NotImplementedError()
 
+    def load_session(self, session_id):
+        """
+        Get session data together with the time the session was touched last.
+        :param session_id:
+        :return: a tuple (data, touched_at), touched_at is None if the backend doesn't track it
+        """
+        return self.get_session_data(session_id), None
+
     def save_session_data(self, session_id, data):
         """
         Save session data to some backend (database, file, etc).
         :param session_id:
         :param data:
+        :return: the time the session was touched last or None if it's unknown
+        """
+        raise NotImplementedError()
+
+    def update_session_data(self, session_id, data):
+        """
+        Save data of a session which has been loaded from the backend. Unlike save_session_data it never
+        creates the session, so a session deleted in the meantime, for example by revoke_user_sessions,
+        stays deleted. Backends which delete sessions should override it.
+        :param session_id:
+        :param data:
+        :return: like save_session_data, None if there is no such session
+        """
+        return self.save_session_data(session_id, data)
+
+    def update_many_session_data(self, items):
+        """
+        Update several sessions at once, see update_session_data.
+        :param items: a list of (session_id, data) tuples
+        :return: a list of values returned by update_session_data for every item
+        """
+        return [self.update_session_data(session_id, data) for session_id, data in items]
+
+    def get_session_data_async(self, session_id):
+        """
+        Like get_session_data, but return a concurrent.futures.Future.
+        By default get_session_data runs in the shared thread pool.
+        """
+        return submit(self.get_session_data, session_id)
+
+    def save_session_data_async(self, session_id, data):
+        """
+        Like save_session_data, but return a concurrent.futures.Future.
+        By default save_session_data runs in the shared thread pool.
+        """
+        return submit(self.save_session_data, session_id, dict(data))
+
+    def save_many_session_data(self, items):
+        """
+        Save several sessions at once. Backends which can write them in bulk should override it.
+        :param items: a list of (session_id, data) tuples
+        :return: a list of values returned by save_session_data for every item
+        """
+        return [self.save_session_data(session_id, data) for session_id, data in items]
+
+    def copy_session_data(self, session_id, data, touched_at):
+        """
+        Store a session moved from another backend, keeping the time it was touched last, so the move
+        doesn't extend its expiration. An existing session isn't overwritten and no signals are sent.
+        By default it's saved with save_session_data, backends which track touched_at should override it.
+        :param session_id:
+        :param data:
+        :param touched_at: the time the session was touched last, as returned by load_session
+        :return: False if the session already exists in the backend
+        """
+        self.save_session_data(session_id, data)
+        return True
+
+    def revoke_user_sessions(self, user_id):
+        """
+        Delete all the sessions of a user, for example after a password change.
+        :param user_id:
+        :return: how many sessions were deleted
+        """
+        raise NotImplementedError()
+
+    def generate_key(self, session):
+        """
+        Generate a key for a new session. If it returns None, a random key is generated.
+        :param sfkit.auth.session.SecureKeySession session: a session the key is generated for
+        """
+        return None
+
+    def is_touch_due(self, touched_at):
+        """
+        Check if the expiration of a session touched at touched_at should be refreshed.
+        If it's not due and the session data is unchanged, the session isn't saved at all.
+        :param touched_at: a value returned by load_session
+        """
+        return True
+
+
+class ISessionCodec(object):
+    """
+    How session data is stored in a database column
+    """
+
+    def encode(self, data):
+        """
+        Encode session data.
+        :param data: a session dict
+        :return: bytes
+        """
+        raise NotImplementedError()
+
+    def decode(self, value):
+        """
+        Decode a stored value, including values stored before the codec was used.
+        :param value:
+        :return: a session dict
+        """
+        raise NotImplementedError()
+
+
+class IRevocationList(object):
+    """
+    A list of revoked session tokens
+    """
+
+    def revoke(self, token):
+        """
+        Revoke a token.
+        :param token:
+        """
+        raise NotImplementedError()
+
+    def is_revoked(self, token, issued_at):
+        """
+        Check if a token issued at issued_at (a unix timestamp) has been revoked.
+        :param token:
+        :param issued_at:
         """
         raise NotImplementedError()
@@ -0,0 +1,254 @@
+# coding: utf-8
+
+import bisect
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .interfaces import ISessionBackend
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+def _hash(value):
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """
+    A consistent hash ring. Every node is placed on the ring many times, so keys spread evenly
+    and adding a node moves only about 1/N of the keys to it.
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        """
+        Constructor.
+        :param nodes: node names
+        :param replicas: how many points every node has on the ring
+        """
+        self.replicas = replicas
+        self.nodes = set()
+        self._points = []
+        self._owners = {}
+
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash(u'{}:{}'.format(node, i))
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+
+        self.nodes.discard(node)
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = dict((point, owner) for point, owner in self._owners.items() if owner != node)
+
+    def get(self, key):
+        """
+        Return the node which owns the key.
+        """
+        if not self._points:
+            raise LookupError('The hash ring is empty')
+
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    def copy(self):
+        ring = HashRing(replicas=self.replicas)
+        ring.nodes = set(self.nodes)
+        ring._points = list(self._points)
+        ring._owners = dict(self._owners)
+        return ring
+
+
+class ShardMetrics(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, duration, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.total_time += duration
+            self.max_time = max(self.max_time, duration)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'total_time': self.total_time,
+                'max_time': self.max_time,
+                'mean_time': self.total_time / self.calls if self.calls else 0.0,
+            }
+
+
+class ShardedSessionBackend(ISessionBackend):
+    """
+    A session backend which spreads sessions over several backends by consistent hashing of session ids.
+
+    A shard is added with a migration window: until finish_migration is called, a session which isn't
+    found on its new shard is read from the shard which owned it before and copied to the new shard
+    with copy_session_data, so sessions which are only read move as well and keep their expiration.
+    The old copy expires and is swept as usual. The reads from the previous shards and revoke_user_sessions
+    are serialized within the process, so a revoked session isn't copied back.
+
+    Shards should share the expiration settings. For example, with SQLite files standing in for servers:
+
+        backends = OrderedDict(
+            ('shard{}'.format(i), SQLAlchemySessionBackend(
+                scoped_session(sessionmaker(bind=create_engine('sqlite:///sessions{}.db'.format(i)))),
+                SessionModel))
+            for i in range(4))
+        backend = ShardedSessionBackend(backends)
+    """
+
+    def __init__(self, shards, replicas=100):
+        """
+        Constructor.
+        :param shards: a dict of shard names and sfkit.auth.session.interfaces.ISessionBackend instances.
+            Names decide the placement of sessions, so keep them stable.
+        :param replicas: how many points every shard has on the hash ring
+        """
+        self.shards = OrderedDict(shards)
+        self.ring = HashRing(self.shards, replicas)
+        self.previous_ring = None
+        self.metrics = dict((name, ShardMetrics()) for name in self.shards)
+        self._lock = threading.Lock()
+
+    def get_shard_name(self, session_id):
+        return self.ring.get(session_id)
+
+    def get_session_data(self, session_id):
+        return self.load_session(session_id)[0]
+
+    def load_session(self, session_id):
+        # take both rings at once, so a finished migration doesn't change them between the reads
+        ring, previous_ring = self.ring, self.previous_ring
+        name = ring.get(session_id)
+        data, touched_at = self._call(name, 'load_session', session_id)
+
+        if data is None and previous_ring is not None:
+            previous_name = previous_ring.get(session_id)
+            if previous_name != name:
+                data, touched_at = self._move(previous_name, name, session_id)
+
+        return data, touched_at
+
+    def save_session_data(self, session_id, data):
+        return self._call(self.get_shard_name(session_id), 'save_session_data', session_id, data)
+
+    def update_session_data(self, session_id, data):
+        return self._call(self.get_shard_name(session_id), 'update_session_data', session_id, data)
+
+    def save_many_session_data(self, items):
+        return self._call_grouped('save_many_session_data', items)
+
+    def update_many_session_data(self, items):
+        return self._call_grouped('update_many_session_data', items)
+
+    def _call_grouped(self, method, items):
+        groups = OrderedDict()
+        for index, (session_id, data) in enumerate(items):
+            groups.setdefault(self.get_shard_name(session_id), []).append((index, session_id, data))
+
+        touched = [None] * len(items)
+
+        for name, group in groups.items():
+            results = self._call(name, method, [(session_id, data) for _, session_id, data in group])
+            for (index, _, _), touched_at in zip(group, results):
+                touched[index] = touched_at
+
+        return touched
+
+    def copy_session_data(self, session_id, data, touched_at):
+        return self._call(self.get_shard_name(session_id), 'copy_session_data', session_id, data, touched_at)
+
+    def revoke_user_sessions(self, user_id):
+        with self._lock:
+            return sum(self._call(name, 'revoke_user_sessions', user_id) for name in self.shards)
+
+    def is_touch_due(self, touched_at):
+        return next(iter(self.shards.values())).is_touch_due(touched_at)
+
+    def add_shard(self, name, backend):
+        """
+        Add a shard and start a migration window.
+        :param name: a shard name
+        :param sfkit.auth.session.interfaces.ISessionBackend backend:
+        """
+        with self._lock:
+            if name in self.shards:
+                raise ValueError('The shard {} already exists'.format(name))
+
+            if self.previous_ring is not None:
+                raise RuntimeError('Finish the current migration before adding a shard')
+
+            ring = self.ring.copy()
+            ring.add(name)
+
+            self.shards[name] = backend
+            self.metrics[name] = ShardMetrics()
+            self.previous_ring = self.ring
+            self.ring = ring
+
+    def finish_migration(self):
+        """
+        Stop reading sessions from their previous shards. Call it once the sessions which haven't been
+        used since the shard was added can be dropped, for example after the expiration period.
+        """
+        with self._lock:
+            self.previous_ring = None
+
+    @property
+    def migrating(self):
+        return self.previous_ring is not None
+
+    def stats(self):
+        """
+        Return calls, errors and latencies in seconds of every shard.
+        """
+        return dict((name, metrics.as_dict()) for name, metrics in self.metrics.items())
+
+    def _move(self, source, target, session_id):
+        # a revocation between the read and the copy would miss the copy, so they don't overlap
+        with self._lock:
+            data, touched_at = self._call(source, 'load_session', session_id)
+
+            if data is not None:
+                try:
+                    self._call(target, 'copy_session_data', session_id, data, touched_at)
+                except Exception:
+                    # the session is still readable from its previous shard, so a failed copy doesn't fail the read
+                    logger.exception('Failed to copy the session to the shard %s', target)
+
+        return data, touched_at
+
+    def _call(self, name, method, *args):
+        started_at = _clock()
+        error = False
+
+        try:
+            return getattr(self.shards[name], method)(*args)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.metrics[name].add(_clock() - started_at, error)
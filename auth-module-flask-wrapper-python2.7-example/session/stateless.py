@@ -0,0 +1,149 @@
+# coding: utf-8
+
+import hashlib
+import threading
+import time
+
+from flask import (
+    current_app,
+    session,
+)
+from itsdangerous import (
+    BadSignature,
+    URLSafeSerializer,
+)
+
+from .interfaces import (
+    IRevocationList,
+    ISessionBackend,
+)
+from ..login import user_logged_out
+
+
+class MemoryRevocationList(IRevocationList):
+    """
+    A revocation list which keeps digests of revoked tokens in the process memory.
+
+    Revocations aren't shared between processes: a token revoked in one worker is still accepted
+    by the others. Use it with a single process only, such as in development or tests.
+
+    Tokens issued after the last revocation can't be in the list, so they're accepted without a lookup.
+    """
+
+    def __init__(self, max_age=30 * 24 * 60 * 60):
+        """
+        Constructor.
+        :param max_age: how long tokens live in seconds, older revocations are forgotten
+        """
+        self.max_age = max_age
+        self.last_revoked_at = None
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    def revoke(self, token):
+        now = time.time()
+
+        with self._lock:
+            self._revoked[self._digest(token)] = now
+            self.last_revoked_at = now
+
+            # tokens which have expired by now can't be used anyway
+            for digest, revoked_at in list(self._revoked.items()):
+                if revoked_at < now - self.max_age:
+                    del self._revoked[digest]
+
+    def is_revoked(self, token, issued_at):
+        last_revoked_at = self.last_revoked_at
+
+        if last_revoked_at is None or issued_at > last_revoked_at:
+            return False
+
+        return self._digest(token) in self._revoked
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+
+class SignedTokenBackend(ISessionBackend):
+    """
+    A session backend which keeps session data in the session token itself.
+
+    The data is serialized, compressed and signed with the application secret key when a new session
+    is generated, so loading a session doesn't need any I/O. Changes made to the session after its token
+    has been generated are not persisted.
+
+    Tokens can only be revoked through the revocation list, so it has to be shared by all the processes
+    which serve the application, for example one kept in a database or redis.
+
+    Logging out changes the session only, which isn't persisted, so the token would keep signing the user
+    in until it expires. Initialize the backend with the application, then logout_user revokes the token
+    of the current session.
+    """
+    default_salt = 'sfkit.auth.session'
+
+    def __init__(self, revocation_list, secret_key=None, max_age=30 * 24 * 60 * 60, salt=None, app=None):
+        """
+        Constructor.
+        :param sfkit.auth.session.interfaces.IRevocationList revocation_list: a list of revoked tokens shared
+            by all the processes
+        :param secret_key: a key to sign tokens with, the application secret key is used by default
+        :param max_age: how long a token lives in seconds
+        :param salt: a namespace of the signature
+        :param app: a flask application, the token of the current session is revoked when a user logs out of it
+        """
+        self.revocation_list = revocation_list
+        self.secret_key = secret_key
+        self.max_age = max_age
+        self.salt = salt if salt is not None else self.default_salt
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Revoke the token of the current session when a user logs out of the application.
+        """
+        user_logged_out.connect(self._on_user_logged_out, sender=app)
+
+    def get_serializer(self):
+        secret_key = self.secret_key if self.secret_key is not None else current_app.secret_key
+        return URLSafeSerializer(secret_key, salt=self.salt)
+
+    def get_session_data(self, session_id):
+        return self.load_session(session_id)[0]
+
+    def load_session(self, session_id):
+        try:
+            payload = self.get_serializer().loads(session_id)
+        except BadSignature:
+            return None, None
+
+        issued_at = payload.get('iat', 0)
+
+        if issued_at < time.time() - self.max_age or self.revocation_list.is_revoked(session_id, issued_at):
+            return None, None
+
+        return payload.get('data'), None
+
+    def save_session_data(self, session_id, data):
+        # the data is already in the token
+        return None
+
+    def generate_key(self, session):
+        return self.get_serializer().dumps({'data': dict(session), 'iat': time.time()})
+
+    def is_touch_due(self, touched_at):
+        return False
+
+    def revoke(self, token):
+        """
+        Revoke a token, so it can't be used anymore.
+        """
+        self.revocation_list.revoke(token)
+
+    def _on_user_logged_out(self, sender, **kwargs):
+        token = getattr(session, 'key', None)
+
+        if token is not None:
+            self.revoke(token)
@@ -0,0 +1,144 @@
+# coding: utf-8
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+import click
+from sqlalchemy import select
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'monotonic', time.time)
+
+#: A report about one deleted batch: how many rows were deleted and how long it took in seconds
+SweepBatch = namedtuple('SweepBatch', ['rows', 'duration'])
+
+
+class SessionSweeper(object):
+    """
+    Delete expired sessions of a sfkit.auth.session.backends.SQLAlchemySessionBackend in small batches.
+
+    Every batch selects up to batch_size expired session ids by expiration_date, so the table should have
+    an index on it, and deletes them in its own transaction. The sweeper pauses between batches to never
+    hold locks for long.
+    """
+
+    def __init__(self, backend, batch_size=1000, pause=0.1):
+        """
+        Constructor.
+        :param sfkit.auth.session.backends.SQLAlchemySessionBackend backend: a backend to clean up
+        :param batch_size: how many rows are deleted at once
+        :param pause: a pause between batches in seconds
+        """
+        self.backend = backend
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def get_cutoff(self):
+        """
+        Sessions touched before the cutoff are expired.
+        """
+        return datetime.utcnow() - timedelta(days=self.backend.expiration)
+
+    def iter_sweep(self, cutoff=None, max_batches=None):
+        """
+        Delete expired sessions batch by batch.
+        :param cutoff: delete sessions touched before this time, by default they're the expired ones
+        :param max_batches: stop after this number of batches
+        :return: a generator of SweepBatch
+        """
+        db_session = self.backend.db_session
+        table = self.backend.session_table.__table__
+        cutoff = cutoff if cutoff is not None else self.get_cutoff()
+        batches = 0
+
+        while max_batches is None or batches < max_batches:
+            started_at = _clock()
+
+            session_ids = [row[0] for row in db_session.execute(
+                select([table.c.session_id]).where(table.c.expiration_date < cutoff).limit(self.batch_size))]
+
+            if not session_ids:
+                db_session.commit()
+                return
+
+            # check the date again in case a session has been touched since it was selected
+            result = db_session.execute(table.delete().where(
+                table.c.session_id.in_(session_ids)).where(table.c.expiration_date < cutoff))
+            db_session.commit()
+
+            batch = SweepBatch(result.rowcount, _clock() - started_at)
+            batches += 1
+            logger.info('Deleted %d expired sessions in %.3fs', batch.rows, batch.duration)
+            yield batch
+
+            if len(session_ids) < self.batch_size:
+                return
+
+            time.sleep(self.pause)
+
+    def sweep(self, cutoff=None, max_batches=None):
+        """
+        Delete expired sessions.
+        :return: a list of SweepBatch
+        """
+        return list(self.iter_sweep(cutoff, max_batches))
+
+    def start(self, app, interval=60 * 60):
+        """
+        Sweep expired sessions periodically in a background thread.
+        :param app: a flask application, the sweeper runs within its context
+        :param interval: a pause between sweeps in seconds
+        :return: an event which stops the thread when it's set
+        """
+        stop_event = threading.Event()
+
+        def run():
+            while not stop_event.is_set():
+                try:
+                    with app.app_context():
+                        self.sweep()
+                except Exception:
+                    logger.exception('Failed to sweep expired sessions')
+
+                stop_event.wait(interval)
+
+        thread = threading.Thread(target=run, name='session-sweeper')
+        thread.daemon = True
+        thread.start()
+        return stop_event
+
+    def init_app(self, app, command_name='sweep-sessions'):
+        """
+        Register a command line command which deletes expired sessions.
+        """
+        sweeper = self
+
+        @app.cli.command(command_name)
+        @click.option('--batch-size', type=int, default=None, help='How many rows are deleted at once.')
+        @click.option('--pause', type=float, default=None, help='A pause between batches in seconds.')
+        @click.option('--max-batches', type=int, default=None, help='Stop after this number of batches.')
+        def sweep_sessions(batch_size, pause, max_batches):
+            """Delete expired sessions."""
+            if batch_size is not None or pause is not None:
+                batch_sweeper = SessionSweeper(sweeper.backend,
+                                               batch_size if batch_size is not None else sweeper.batch_size,
+                                               pause if pause is not None else sweeper.pause)
+            else:
+                batch_sweeper = sweeper
+
+            rows = 0
+            duration = 0.0
+
+            for number, batch in enumerate(batch_sweeper.iter_sweep(max_batches=max_batches), 1):
+                rows += batch.rows
+                duration += batch.duration
+                click.echo('batch {}: {} rows in {:.3f}s'.format(number, batch.rows, batch.duration))
+
+            click.echo('deleted {} rows in {:.3f}s'.format(rows, duration))
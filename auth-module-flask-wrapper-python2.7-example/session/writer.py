@@ -0,0 +1,292 @@
+# coding: utf-8
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from .interfaces import ISessionBackend
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class AsyncSessionWriter(ISessionBackend):
+    """
+    A session backend which saves sessions to another backend from a background thread.
+
+    Writes of the same session which are waiting in the queue are merged into one and the worker
+    saves them in batches. Until a session is written, it's read from the queue, so the process
+    which saved it always reads its own writes. Other processes see the change once it's flushed.
+    """
+    _missing = object()
+
+    def __init__(self, backend, app=None, max_pending=10000, batch_size=100, flush_interval=0.05,
+                 put_timeout=0.5):
+        """
+        Constructor.
+        :param sfkit.auth.session.interfaces.ISessionBackend backend: a backend to write sessions to
+        :param app: a flask application, the worker writes sessions within its context and the queue
+            is flushed when the process exits
+        :param max_pending: how many sessions can wait for writing
+        :param batch_size: how many sessions are written at once
+        :param flush_interval: how long the worker waits for more sessions before writing a batch in seconds
+        :param put_timeout: how long a request waits for a free place in the full queue in seconds,
+            then the session is saved synchronously
+        """
+        self.backend = backend
+        self.app = app
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+
+        self.metrics = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'blocked': 0,
+            'blocked_time': 0.0,
+            'sync_writes': 0,
+            'max_pending': 0,
+        }
+
+        self._pending = OrderedDict()
+        self._in_flight = {}
+        self._condition = threading.Condition()
+        self._flushing = False
+        self._closed = False
+        self._worker = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Bind the writer to an application and flush it when the process exits.
+        """
+        self.app = app
+        atexit.register(self.close)
+
+    def get_session_data(self, session_id):
+        return self.load_session(session_id)[0]
+
+    def load_session(self, session_id):
+        with self._condition:
+            entry = self._pending.get(session_id, self._in_flight.get(session_id, self._missing))
+
+        if entry is not self._missing:
+            return dict(entry[0]), None
+
+        return self.backend.load_session(session_id)
+
+    def save_session_data(self, session_id, data):
+        return self._enqueue(session_id, data, create=True)
+
+    def update_session_data(self, session_id, data):
+        return self._enqueue(session_id, data, create=False)
+
+    def _enqueue(self, session_id, data, create):
+        data = dict(data)
+
+        if self.app is None:
+            self.app = current_app._get_current_object()
+
+        with self._condition:
+            if not self._closed:
+                if session_id in self._pending:
+                    # a queued creation stays a creation
+                    self._pending[session_id] = (data, create or self._pending[session_id][1])
+                    self.metrics['coalesced'] += 1
+                    return None
+
+                if self._wait_for_room():
+                    self._pending[session_id] = (data, create)
+                    self.metrics['enqueued'] += 1
+                    self.metrics['max_pending'] = max(self.metrics['max_pending'], len(self._pending))
+                    self._start()
+                    self._condition.notify_all()
+                    return None
+
+        # the queue is full or closed, so apply back pressure by saving it right away
+        self._count(sync_writes=1)
+        return self._save(session_id, data, create)
+
+    def _save(self, session_id, data, create):
+        if create:
+            return self.backend.save_session_data(session_id, data)
+
+        return self.backend.update_session_data(session_id, data)
+
+    def copy_session_data(self, session_id, data, touched_at):
+        # a copy is rare and must not overwrite a newer session, so it isn't queued
+        return self.backend.copy_session_data(session_id, data, touched_at)
+
+    def is_touch_due(self, touched_at):
+        return self.backend.is_touch_due(touched_at)
+
+    def generate_key(self, session):
+        return self.backend.generate_key(session)
+
+    def revoke_user_sessions(self, user_id):
+        """
+        Drop the queued sessions of a user, wait for the ones being written and delete the sessions
+        from the backend.
+        """
+        def is_user_session(entry):
+            return entry[0].get(self.user_id_key) == user_id
+
+        with self._condition:
+            for session_id, entry in list(self._pending.items()):
+                if is_user_session(entry):
+                    del self._pending[session_id]
+
+            self._condition.notify_all()
+
+            while any(is_user_session(entry) for entry in self._in_flight.values()):
+                self._condition.wait()
+
+        return self.backend.revoke_user_sessions(user_id)
+
+    def flush(self, timeout=None):
+        """
+        Write all the queued sessions and wait for it.
+        :param timeout: how long to wait in seconds
+        :return: True if everything has been written
+        """
+        deadline = None if timeout is None else _clock() + timeout
+
+        with self._condition:
+            self._flushing = True
+            self._condition.notify_all()
+
+            while self._pending or self._in_flight:
+                if self._worker is None:
+                    break
+
+                remaining = None if deadline is None else deadline - _clock()
+                if remaining is not None and remaining <= 0:
+                    break
+
+                self._condition.wait(remaining)
+
+            self._flushing = False
+            return not self._pending and not self._in_flight
+
+    def close(self, timeout=None):
+        """
+        Stop accepting new sessions, write the queued ones and stop the worker.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            worker = self._worker
+
+        if worker is not None:
+            worker.join(timeout)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self.metrics)
+            stats['pending'] = len(self._pending)
+            stats['in_flight'] = len(self._in_flight)
+
+        return stats
+
+    def _wait_for_room(self):
+        if len(self._pending) < self.max_pending:
+            return True
+
+        self.metrics['blocked'] += 1
+        started_at = _clock()
+        deadline = started_at + self.put_timeout
+
+        while len(self._pending) >= self.max_pending and not self._closed:
+            remaining = deadline - _clock()
+            if remaining <= 0:
+                break
+            self._condition.wait(remaining)
+
+        self.metrics['blocked_time'] += _clock() - started_at
+        return len(self._pending) < self.max_pending and not self._closed
+
+    def _start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='session-writer')
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+
+                if not self._pending:
+                    # closed and nothing left to write
+                    self._worker = None
+                    self._condition.notify_all()
+                    return
+
+                # give other writes a chance to join the batch
+                deadline = _clock() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closed and not self._flushing:
+                    remaining = deadline - _clock()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popitem(last=False))
+
+                self._in_flight.update(batch)
+                self._condition.notify_all()
+
+            self._write(batch)
+
+            with self._condition:
+                for session_id, _ in batch:
+                    self._in_flight.pop(session_id, None)
+                self._condition.notify_all()
+
+    def _write(self, batch):
+        creates = [(session_id, data) for session_id, (data, create) in batch if create]
+        updates = [(session_id, data) for session_id, (data, create) in batch if not create]
+
+        with self.app.app_context():
+            try:
+                if creates:
+                    self.backend.save_many_session_data(creates)
+                if updates:
+                    self.backend.update_many_session_data(updates)
+            except Exception:
+                # one bad session shouldn't cost the whole batch, so save them one by one
+                logger.exception('Failed to write %d sessions, writing them one by one', len(batch))
+                self._write_one_by_one(batch)
+            else:
+                self._count(written=len(batch))
+            finally:
+                self._count(batches=1)
+
+    def _write_one_by_one(self, batch):
+        for session_id, (data, create) in batch:
+            try:
+                self._save(session_id, data, create)
+            except Exception:
+                logger.exception('Failed to write the session %s', session_id)
+                self._count(failed=1)
+            else:
+                self._count(written=1, sync_writes=1)
+
+    def _count(self, **increments):
+        # stats() reads the metrics under the lock, so they're changed under it as well
+        with self._condition:
+            for name, value in increments.items():
+                self.metrics[name] += value
@@ -0,0 +1,773 @@
+# coding: utf-8
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import sqlalchemy as sa
+from flask import (
+    Flask,
+    _request_ctx_stack,
+    request as flask_request,
+)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import (
+    scoped_session,
+    sessionmaker,
+)
+
+try:
+    from http.server import (
+        BaseHTTPRequestHandler,
+        HTTPServer,
+    )
+    from socketserver import ThreadingMixIn
+    from urllib.parse import (
+        parse_qs,
+        urlparse,
+    )
+except ImportError:
+    from BaseHTTPServer import (
+        BaseHTTPRequestHandler,
+        HTTPServer,
+    )
+    from SocketServer import ThreadingMixIn
+    from urlparse import (
+        parse_qs,
+        urlparse,
+    )
+
+from .authorization.interfaces import (
+    IStrategyDataSource,
+    IUserLoader,
+)
+from .authorization.strategies import (
+    FacebookStrategy,
+    SimpleStrategy,
+)
+from .authorization.view import AuthorizationControllerView
+from .benchmarks import (
+    BenchPasswordDelegate,
+    create_bench_db,
+)
+from .errors import (
+    AccountNotFound,
+    EmailAlreadyExists,
+    FacebookNotFound,
+    IncorrectFacebookToken,
+    InvalidRegistrationData,
+    NoCredentialDataProvided,
+    NoFacebookToken,
+    WrongAuthorizationData,
+)
+from . import cache
+from .facebook_loader import (
+    CachedFacebookLoader,
+    GraphUnavailable,
+    PooledFacebookLoader,
+)
+from .interfaces import (
+    IFacebookLoader,
+    IStrategyRegistryDataSource,
+)
+from .login import (
+    LoginManager,
+    UserMixin,
+    login_user,
+    logout_user,
+)
+from .registration.bulk import BulkRegistration
+from .registration.db import SAViewDbDelegate
+from .session import CommonSessionInterface
+from .session.backends import (
+    CachedSessionBackend,
+    SQLAlchemySessionBackend,
+)
+from .session.interfaces import ISessionBackend
+from .session.sharding import ShardedSessionBackend
+from .session.sources import HeaderSource
+from .session.stateless import (
+    MemoryRevocationList,
+    SignedTokenBackend,
+)
+from .session.writer import AsyncSessionWriter
+from . import (
+    StrategyRegistry,
+    timing,
+)
+
+Base = declarative_base()
+
+
+class SessionModel(Base):
+    __tablename__ = 'sessions'
+
+    session_id = sa.Column(sa.String(64), primary_key=True)
+    session_data = sa.Column(sa.PickleType)
+    expiration_date = sa.Column(sa.DateTime, index=True)
+    user_id = sa.Column(sa.Integer, index=True)
+
+
+class FakeUser(UserMixin):
+    def __init__(self, id, email=None, facebook_id=None, password=None):
+        self.id = id
+        self.email = email
+        self.facebook_id = facebook_id
+        self.password = password
+        self.password_delegate = None
+
+    def compare_passwords(self, password):
+        return password == self.password
+
+
+class FakePasswordDelegate(object):
+    pass
+
+
+class FakeDataSource(IStrategyDataSource):
+    def __init__(self, data):
+        self.data = data
+
+    def get_authorization_data(self):
+        return self.data
+
+
+class FakeUserLoader(IUserLoader):
+    def __init__(self, users):
+        self.users = users
+
+    def load(self, **params):
+        for user in self.users:
+            if all(getattr(user, name) == value for name, value in params.items()):
+                return user
+
+    def save(self, user):
+        pass
+
+
+class FakeFacebookLoader(IFacebookLoader):
+    def __init__(self, accounts):
+        self.accounts = accounts
+
+    def load(self, facebook_token):
+        return self.accounts.get(facebook_token)
+
+
+class FakeSessionBackend(ISessionBackend):
+    touched_at = 1
+
+    def __init__(self):
+        self.sessions = {}
+
+    def get_session_data(self, session_id):
+        return self.load_session(session_id)[0]
+
+    def load_session(self, session_id):
+        entry = self.sessions.get(session_id)
+
+        if entry is None:
+            return None, None
+
+        return dict(entry[0]), entry[1]
+
+    def save_session_data(self, session_id, data):
+        self.sessions[session_id] = (dict(data), self.touched_at)
+        return self.touched_at
+
+
+class AsyncTestCase(unittest.TestCase):
+    """
+    Runs the blocking methods and their *_async counterparts against the same fakes within a request.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.context = self.app.test_request_context('/')
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def assertSameAuthorization(self, strategy):
+        sync_errors = []
+        async_errors = []
+
+        user = strategy.authorize(sync_errors.append)
+        async_user = strategy.authorize_async(async_errors.append).result(timeout=5)
+
+        self.assertIs(user, async_user)
+        self.assertEqual([type(error) for error in sync_errors], [type(error) for error in async_errors])
+
+        return user, sync_errors
+
+
+class AuthorizeAsyncTest(AsyncTestCase):
+    def setUp(self):
+        super(AuthorizeAsyncTest, self).setUp()
+        self.user = FakeUser(1, email='user@example.com', facebook_id='10', password='secret')
+        self.user_loader = FakeUserLoader([self.user])
+
+    def create_facebook_strategy(self, data):
+        strategy = FacebookStrategy(self.user_loader, FakeDataSource(data))
+        strategy.facebook_loader = FakeFacebookLoader({'valid': {'id': '10'}, 'stranger': {'id': '20'}})
+        return strategy
+
+    def create_simple_strategy(self, data):
+        strategy = SimpleStrategy(self.user_loader, FakeDataSource(data))
+        strategy.password_delegate = FakePasswordDelegate
+        return strategy
+
+    def test_facebook(self):
+        user, errors = self.assertSameAuthorization(self.create_facebook_strategy({'facebook_token': 'valid'}))
+        self.assertIs(user, self.user)
+        self.assertEqual(errors, [])
+
+    def test_facebook_errors(self):
+        cases = [
+            ({}, NoFacebookToken),
+            ({'facebook_token': 'invalid'}, IncorrectFacebookToken),
+            ({'facebook_token': 'stranger'}, FacebookNotFound),
+        ]
+
+        for data, error_class in cases:
+            user, errors = self.assertSameAuthorization(self.create_facebook_strategy(data))
+            self.assertIsNone(user)
+            self.assertEqual([type(error) for error in errors], [error_class])
+
+    def test_simple(self):
+        strategy = self.create_simple_strategy({'login': 'user@example.com', 'password': 'secret'})
+        user, errors = self.assertSameAuthorization(strategy)
+        self.assertIs(user, self.user)
+        self.assertEqual(errors, [])
+
+    def test_simple_errors(self):
+        cases = [
+            ({'login': 'user@example.com'}, NoCredentialDataProvided),
+            ({'login': 'nobody@example.com', 'password': 'secret'}, AccountNotFound),
+            ({'login': 'user@example.com', 'password': 'wrong'}, WrongAuthorizationData),
+        ]
+
+        for data, error_class in cases:
+            user, errors = self.assertSameAuthorization(self.create_simple_strategy(data))
+            self.assertIsNone(user)
+            self.assertEqual([type(error) for error in errors], [error_class])
+
+    def test_error_callback_raises(self):
+        strategy = self.create_simple_strategy({'login': 'nobody@example.com', 'password': 'secret'})
+
+        def error_callback(error):
+            raise error
+
+        self.assertRaises(AccountNotFound, strategy.authorize, error_callback)
+        self.assertRaises(AccountNotFound, strategy.authorize_async(error_callback).result, 5)
+
+
+class LoadAsyncTest(AsyncTestCase):
+    def setUp(self):
+        super(LoadAsyncTest, self).setUp()
+        self.loader = FakeFacebookLoader({'valid': {'id': '10'}})
+
+    def assertSameLoad(self, loader, token):
+        account = loader.load(token)
+        self.assertEqual(account, loader.load_async(token).result(timeout=5))
+        return account
+
+    def test_load(self):
+        self.assertEqual(self.assertSameLoad(self.loader, 'valid'), {'id': '10'})
+        self.assertIsNone(self.assertSameLoad(self.loader, 'invalid'))
+
+    def test_cached_load(self):
+        loader = CachedFacebookLoader(self.loader)
+
+        # the first async load misses the cache, the second one is served from it
+        for _ in range(2):
+            self.assertEqual(loader.load_async('valid').result(timeout=5), {'id': '10'})
+            self.assertIsNone(loader.load_async('invalid').result(timeout=5))
+
+        self.assertEqual(self.assertSameLoad(loader, 'valid'), {'id': '10'})
+        self.assertIsNone(self.assertSameLoad(loader, 'invalid'))
+
+
+class GraphStubServer(ThreadingMixIn, HTTPServer):
+    """
+    A local stand-in for the Graph API. Every token has a list of responses (status, body, delay),
+    they're given in turn and the last one repeats.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), GraphStubHandler)
+        self.responses = {}
+        self.requests = {}
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def respond(self, token):
+        count = self.requests[token] = self.requests.get(token, 0) + 1
+        responses = self.responses[token]
+        return responses[min(count, len(responses)) - 1]
+
+    def handle_error(self, request, client_address):
+        # clients which have timed out close their connections before the response
+        pass
+
+
+class GraphStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        token = parse_qs(urlparse(self.path).query)['access_token'][0]
+        status, body, delay = self.server.respond(token)
+
+        if delay:
+            time.sleep(delay)
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledFacebookLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.server = GraphStubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.loader = PooledFacebookLoader(self.server.url, version='v2.8', retries=2, backoff=0, read_timeout=0.2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.loader.pool.clear()
+
+    def stub(self, token, *responses):
+        self.server.responses[token] = [response + (0,) * (3 - len(response)) for response in responses]
+
+    def test_account(self):
+        self.stub('valid', (200, {'id': '10', 'name': 'User'}))
+        self.assertEqual(self.loader.load('valid'), {'id': '10', 'name': 'User'})
+
+    def test_invalid_token(self):
+        self.stub('expired', (400, {'error': {'type': 'OAuthException', 'code': 190, 'message': 'Expired'}}))
+        self.stub('revoked', (400, {'error': {'code': 2500, 'message': 'Revoked'}}))
+
+        self.assertIsNone(self.loader.load('expired'))
+        self.assertIsNone(self.loader.load('revoked'))
+        self.assertEqual(self.server.requests, {'expired': 1, 'revoked': 1})
+
+    def test_throttling(self):
+        # throttling isn't retried and isn't taken for an invalid token
+        self.stub('limited', (429, {'error': {'type': 'OAuthException', 'code': 4, 'message': 'Limited'}}))
+        self.stub('app_limited', (403, {'error': {'type': 'OAuthException', 'code': 4, 'message': 'Limited'}}))
+
+        self.assertRaises(GraphUnavailable, self.loader.load, 'limited')
+        self.assertRaises(GraphUnavailable, self.loader.load, 'app_limited')
+        self.assertEqual(self.server.requests, {'limited': 1, 'app_limited': 1})
+
+    def test_server_error_is_retried(self):
+        self.stub('flaky', (500, {'error': {'message': 'Oops'}}), (200, {'id': '10'}))
+        self.stub('down', (503, {'error': {'message': 'Down'}}))
+
+        self.assertEqual(self.loader.load('flaky'), {'id': '10'})
+        self.assertRaises(GraphUnavailable, self.loader.load, 'down')
+        self.assertEqual(self.server.requests, {'flaky': 2, 'down': 3})
+
+    def test_timeout(self):
+        self.stub('slow', (200, {'id': '10'}, 1), (200, {'id': '10'}))
+        self.stub('stuck', (200, {'id': '10'}, 1))
+
+        self.assertEqual(self.loader.load('slow'), {'id': '10'})
+        self.assertRaises(GraphUnavailable, self.loader.load, 'stuck')
+        self.assertEqual(self.server.requests, {'slow': 2, 'stuck': 3})
+
+
+class CountingFacebookLoader(IFacebookLoader):
+    def __init__(self, accounts, release=None):
+        self.accounts = accounts
+        self.release = release
+        self.calls = 0
+
+    def load(self, facebook_token):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return self.accounts.get(facebook_token)
+
+
+class CachedFacebookLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.clock = cache._clock
+        cache._clock = lambda: self.now
+
+    def tearDown(self):
+        cache._clock = self.clock
+
+    def test_single_flight(self):
+        release = threading.Event()
+        loader = CachedFacebookLoader(CountingFacebookLoader({'valid': {'id': '10'}}, release))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(loader.load('valid'))) for _ in range(5)]
+
+        for thread in threads:
+            thread.start()
+
+        # the concurrent loads wait for the first one
+        while not loader.loader.calls:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, [{'id': '10'}] * 5)
+        self.assertEqual(loader.loader.calls, 1)
+
+    def test_negative_ttl(self):
+        loader = CachedFacebookLoader(CountingFacebookLoader({'valid': {'id': '10'}}), ttl=300, negative_ttl=30)
+
+        self.assertEqual(loader.load('valid'), {'id': '10'})
+        self.assertIsNone(loader.load('invalid'))
+        self.assertIsNone(loader.load('invalid'))
+        self.assertEqual(loader.loader.calls, 2)
+
+        # an invalid token expires sooner than an account
+        self.now += 31
+        self.assertEqual(loader.load('valid'), {'id': '10'})
+        self.assertIsNone(loader.load('invalid'))
+        self.assertEqual(loader.loader.calls, 3)
+
+
+class SessionAsyncTest(AsyncTestCase):
+    def assertSameSessions(self, backend):
+        self.assertEqual(backend.save_session_data('sync', {'user_id': 1}),
+                         backend.save_session_data_async('async', {'user_id': 1}).result(timeout=5))
+
+        for session_id in ('sync', 'async', 'missing'):
+            self.assertEqual(backend.get_session_data(session_id),
+                             backend.get_session_data_async(session_id).result(timeout=5))
+
+        self.assertEqual(backend.get_session_data('sync'), {'user_id': 1})
+        self.assertEqual(backend.get_session_data('async'), {'user_id': 1})
+        self.assertIsNone(backend.get_session_data('missing'))
+
+    def test_backend(self):
+        self.assertSameSessions(FakeSessionBackend())
+
+    def test_cached_backend(self):
+        backend = CachedSessionBackend(FakeSessionBackend())
+        self.assertSameSessions(backend)
+
+        # reads of cached sessions and misses which go to the wrapped backend
+        backend.cache.delete('sync')
+        self.assertEqual(backend.get_session_data_async('sync').result(timeout=5), {'user_id': 1})
+        self.assertEqual(backend.get_session_data_async('sync').result(timeout=5), {'user_id': 1})
+
+    def test_async_save_copies_data(self):
+        backend = FakeSessionBackend()
+        data = {'user_id': 1}
+
+        future = backend.save_session_data_async('async', data)
+        data['user_id'] = 2
+        future.result(timeout=5)
+
+        self.assertEqual(backend.get_session_data('async'), {'user_id': 1})
+
+
+class AsyncSessionWriterTest(unittest.TestCase):
+    def test_metrics_add_up(self):
+        app = Flask(__name__)
+        backend = FakeSessionBackend()
+        # a short queue without waiting, so requests write synchronously as well
+        writer = AsyncSessionWriter(backend, app=app, max_pending=5, batch_size=3, flush_interval=0,
+                                    put_timeout=0)
+
+        def save(thread_index):
+            with app.app_context():
+                for i in range(100):
+                    writer.save_session_data('session{}-{}'.format(thread_index, i), {'user_id': i})
+
+        threads = [threading.Thread(target=save, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        writer.close(timeout=10)
+        stats = writer.stats()
+
+        self.assertEqual(len(backend.sessions), 800)
+        self.assertEqual(stats['enqueued'] + stats['sync_writes'], 800)
+        self.assertEqual(stats['written'], stats['enqueued'])
+        self.assertEqual(stats['failed'], 0)
+
+
+class ShardMigrationTest(AsyncTestCase):
+    """
+    Moves sessions to an added shard, every shard is a separate SQLite file.
+    """
+
+    def setUp(self):
+        super(ShardMigrationTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.db_sessions = []
+
+    def tearDown(self):
+        for db_session in self.db_sessions:
+            db_session.remove()
+            db_session.bind.dispose()
+
+        shutil.rmtree(self.directory)
+        super(ShardMigrationTest, self).tearDown()
+
+    def create_backend(self, name):
+        engine = sa.create_engine('sqlite:///{}'.format(os.path.join(self.directory, name + '.db')))
+        Base.metadata.create_all(engine)
+
+        db_session = scoped_session(sessionmaker(bind=engine))
+        self.db_sessions.append(db_session)
+        return SQLAlchemySessionBackend(db_session, SessionModel, user_id_column='user_id')
+
+    def start_migration(self):
+        """
+        Save sessions to three shards and add the fourth one.
+        :return: a tuple (sharded backend, new shard, session ids, ids of the sessions which move)
+        """
+        backend = ShardedSessionBackend(
+            (name, self.create_backend(name)) for name in ('shard0', 'shard1', 'shard2'))
+        session_ids = ['session{}'.format(i) for i in range(200)]
+
+        for i, session_id in enumerate(session_ids):
+            backend.save_session_data(session_id, {'user_id': i})
+
+        new_shard = self.create_backend('shard3')
+        backend.add_shard('shard3', new_shard)
+        moved = [session_id for session_id in session_ids if backend.get_shard_name(session_id) == 'shard3']
+
+        self.assertTrue(moved)
+        self.assertIsNone(new_shard.get_session_data(moved[0]))
+
+        return backend, new_shard, session_ids, moved
+
+    def test_read_sessions_move(self):
+        backend, new_shard, session_ids, moved = self.start_migration()
+        touched = dict((session_id, backend.shards[backend.previous_ring.get(session_id)].load_session(session_id)[1])
+                       for session_id in moved)
+
+        # sessions are only read during the migration window
+        for i, session_id in enumerate(session_ids):
+            self.assertEqual(backend.get_session_data(session_id), {'user_id': i})
+
+        # and keep their expiration
+        for session_id in moved:
+            self.assertEqual(new_shard.load_session(session_id),
+                             ({'user_id': session_ids.index(session_id)}, touched[session_id]))
+
+        backend.finish_migration()
+
+        for i, session_id in enumerate(session_ids):
+            self.assertEqual(backend.get_session_data(session_id), {'user_id': i})
+
+    def test_revoked_session_isnt_copied(self):
+        backend, new_shard, session_ids, moved = self.start_migration()
+        session_id = moved[0]
+        previous_shard = backend.shards[backend.previous_ring.get(session_id)]
+        load_session = previous_shard.load_session
+        revocation = threading.Thread(target=backend.revoke_user_sessions, args=(session_ids.index(session_id),))
+
+        def load_and_revoke(session_id):
+            # the session is revoked after the read from the previous shard, before the copy
+            result = load_session(session_id)
+            revocation.start()
+            revocation.join(0.5)
+            return result
+
+        previous_shard.load_session = load_and_revoke
+        backend.get_session_data(session_id)
+        del previous_shard.load_session
+        revocation.join(5)
+
+        self.assertIsNone(backend.get_session_data(session_id))
+        self.assertIsNone(new_shard.get_session_data(session_id))
+
+
+class SignedTokenLogoutTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.secret_key = 'secret'
+        self.app.session_interface = CommonSessionInterface(
+            SignedTokenBackend(MemoryRevocationList(), app=self.app), HeaderSource())
+
+        self.user = FakeUser(1)
+        login_manager = LoginManager(self.app)
+        login_manager.user_loader(lambda user_id: self.user if user_id == self.user.id else None)
+
+    def request(self, view, token=None):
+        headers = {HeaderSource.default_header_name: token} if token is not None else {}
+
+        with self.app.test_request_context('/', headers=headers):
+            session = self.app.session_interface.open_session(self.app, flask_request)
+            _request_ctx_stack.top.session = session
+            view(session)
+            self.app.session_interface.save_session(self.app, session, None)
+            return dict(session)
+
+    def test_logout_revokes_token(self):
+        tokens = []
+
+        def sign_in(session):
+            login_user(self.user, force=True)
+            tokens.append(session.generate_new())
+
+        self.request(sign_in)
+        self.assertEqual(self.request(lambda session: None, tokens[0]), {'user_id': 1})
+
+        self.request(lambda session: logout_user(), tokens[0])
+        self.assertEqual(self.request(lambda session: None, tokens[0]), {})
+
+
+class BulkRegistrationTest(unittest.TestCase):
+    def setUp(self):
+        self.db, self.User, _ = create_bench_db(users=1)
+        self.registered = []
+
+        self.registration = BulkRegistration(SAViewDbDelegate(self.db, self.User), delegate=self)
+        self.registration.strategy.password_delegate = BenchPasswordDelegate
+
+    def tearDown(self):
+        self.db.session.remove()
+
+    def will_register(self, user):
+        return True
+
+    def did_register(self, user):
+        self.registered.append(user.id)
+
+    def test_register(self):
+        results = list(self.registration.register([
+            {'login': 'new0@example.com', 'password': 'secret'},
+            ['not', 'an', 'object'],
+            {'login': 'new1@example.com', 'password': 'secret'},
+            {'login': 'user0@example.com', 'password': 'secret'},
+        ]))
+
+        self.assertEqual([type(result.error) for result in results],
+                         [type(None), InvalidRegistrationData, type(None), EmailAlreadyExists])
+
+        # bulk saved users have their ids, like the ones registered one by one
+        ids = [results[0].user.id, results[2].user.id]
+        self.assertNotIn(None, ids)
+        self.assertEqual(sorted(self.registered), sorted(ids))
+
+
+class FakeRegistryDataSource(IStrategyRegistryDataSource):
+    def __init__(self, type_name):
+        self.type_name = type_name
+
+    def get_type_name(self):
+        return self.type_name
+
+
+class StrategyRegistryTest(unittest.TestCase):
+    def test_lazy_strategy_without_factory(self):
+        data_source = FakeRegistryDataSource('facebook')
+        registry = StrategyRegistry(data_source)
+        registry.add_lazy('facebook', '{}:FacebookStrategy'.format(__name__))
+
+        strategy = registry.find()
+
+        self.assertIsInstance(strategy, FacebookStrategy)
+        self.assertIs(strategy.user_loader, data_source)
+        self.assertIs(strategy.data_source, data_source)
+        self.assertIs(registry.find(), strategy)
+
+    def test_lazy_strategy_with_factory(self):
+        registry = StrategyRegistry(FakeRegistryDataSource('simple'))
+        registry.strategy_factory = lambda strategy_class: strategy_class(None, None)
+        registry.add_lazy('simple', '{}.SimpleStrategy'.format(__name__))
+
+        strategy = registry.find()
+
+        self.assertIsInstance(strategy, SimpleStrategy)
+        self.assertIsNone(strategy.user_loader)
+
+
+class StrategyControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def test_shared_registry(self):
+        class View(AuthorizationControllerView):
+            pass
+
+        with self.app.test_request_context('/'):
+            view = View(None)
+            registry = view.strategy_registry
+            self.assertIs(registry.available_strategies['simple'].user_loader.db_delegate, view.db_delegate)
+
+        with self.app.test_request_context('/'):
+            other_view = View('db')
+            self.assertIs(other_view.strategy_registry, registry)
+            self.assertEqual(registry.available_strategies['simple'].user_loader.db_delegate, 'db')
+
+    def test_no_request_context(self):
+        class View(AuthorizationControllerView):
+            pass
+
+        self.assertRaises(RuntimeError, View, None)
+
+    def test_instance_hooks(self):
+        class View(AuthorizationControllerView):
+            def _add_strategies(self, strategy_registry):
+                strategy = SimpleStrategy(self, self)
+                strategy.name = 'custom'
+                strategy_registry.add(strategy)
+
+        # overriding views build their own registries, as before the registry was shared
+        view = View(None)
+        other_view = View(None)
+
+        self.assertEqual(list(view.strategy_registry.available_strategies), ['custom'])
+        self.assertIs(view.strategy_registry.available_strategies['custom'].user_loader, view)
+        self.assertIsNot(other_view.strategy_registry, view.strategy_registry)
+
+
+class TimingTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        timing.AuthTiming(self.app)
+
+        self.now = 0.0
+        self.clock = timing._clock
+        timing._clock = lambda: self.now
+
+    def tearDown(self):
+        timing._clock = self.clock
+
+    def test_nested_phases_are_exclusive(self):
+        with self.app.test_request_context('/'):
+            with timing.phase('strategy'):
+                self.now += 1
+                with timing.phase('password_hash'):
+                    self.now += 10
+                self.now += 2
+                with timing.phase('user_lookup'):
+                    self.now += 100
+            with timing.phase('token'):
+                self.now += 1000
+
+            self.assertEqual(dict(timing.get_timings()),
+                             {'strategy': 3, 'password_hash': 10, 'user_lookup': 100, 'token': 1000})
+
+
+if __name__ == '__main__':
+    unittest.main()
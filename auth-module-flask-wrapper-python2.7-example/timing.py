@@ -0,0 +1,209 @@
+# coding: utf-8
+"""
+Per-request timings of the auth phases, such as request parsing, password hashing or a session save.
+
+Phases are measured only in applications where AuthTiming is initialized, elsewhere phase() returns
+a shared no-op context manager after a single global check.
+
+Phases are exclusive: while a nested phase runs, such as password_hash within strategy, its time isn't
+counted to the enclosing phase. So the durations of a request don't overlap and add up in Server-Timing.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import (
+    current_app,
+    g,
+    has_request_context,
+    request,
+)
+
+logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'monotonic', time.time)
+
+#: True once AuthTiming is initialized for any application
+_enabled = False
+
+
+class _NoopPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_noop_phase = _NoopPhase()
+
+
+class _Phase(object):
+    __slots__ = ('timings', 'stack', 'name', 'started_at')
+
+    def __init__(self, timings, stack, name):
+        self.timings = timings
+        self.stack = stack
+        self.name = name
+        self.started_at = None
+
+    def __enter__(self):
+        now = _clock()
+
+        # the enclosing phase is paused until this one ends
+        if self.stack:
+            self.stack[-1]._add(now)
+
+        self.stack.append(self)
+        self.started_at = now
+        return self
+
+    def __exit__(self, *exc_info):
+        now = _clock()
+        self._add(now)
+        self.stack.pop()
+
+        if self.stack:
+            self.stack[-1].started_at = now
+
+        return False
+
+    def _add(self, now):
+        # a phase which runs several times in a request is summed up
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + now - self.started_at
+
+
+def get_timings():
+    """
+    Return an ordered dict of phase names and their durations in seconds for the current request,
+    or None if timing is disabled.
+    """
+    if not _enabled or not has_request_context():
+        return None
+
+    timings = getattr(g, '_auth_timings', None)
+
+    # it's created on the first phase, because the session is loaded before before_request handlers
+    if timings is None and AuthTiming.extension_name in current_app.extensions:
+        timings = g._auth_timings = OrderedDict()
+
+    return timings
+
+
+def phase(name):
+    """
+    Measure a block of code as a phase of the current request, excluding the nested phases:
+
+        with phase('password_hash'):
+            ...
+    """
+    timings = get_timings()
+
+    if timings is None:
+        return _noop_phase
+
+    stack = getattr(g, '_auth_phases', None)
+    if stack is None:
+        stack = g._auth_phases = []
+
+    return _Phase(timings, stack, name)
+
+
+def timed(name):
+    """
+    A decorator which measures every call of a function as a phase.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class IMetricsSink(object):
+    """
+    Receives the phase timings of every request
+    """
+
+    def record(self, endpoint, timings):
+        """
+        Record timings of a finished request.
+        :param endpoint: a flask endpoint of the request
+        :param timings: an ordered dict of phase names and their durations in seconds
+        """
+        raise NotImplementedError()
+
+
+class LoggingMetricsSink(IMetricsSink):
+    """
+    Writes the timings to a log with the debug level.
+    """
+
+    def __init__(self, log=None):
+        self.logger = log if log is not None else logger
+
+    def record(self, endpoint, timings):
+        self.logger.debug('%s %s', endpoint, ' '.join('{}={:.2f}ms'.format(name, duration * 1000)
+                                                      for name, duration in timings.items()))
+
+
+class AuthTiming(object):
+    """
+    A flask extension which turns the phase timings on.
+
+    The timings measured by the time the response is built are sent in the Server-Timing header.
+    The session is saved after that, so the session_save phase goes to the metrics sink only.
+    """
+    extension_name = 'sfkit_auth_timing'
+
+    def __init__(self, app=None, sink=None, server_timing=True):
+        """
+        Constructor.
+        :param app: a flask application
+        :param IMetricsSink sink: where the timings of every request are published
+        :param server_timing: add the Server-Timing header to responses
+        """
+        self.sink = sink
+        self.server_timing = server_timing
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        global _enabled
+        _enabled = True
+
+        app.extensions[self.extension_name] = self
+
+        if self.server_timing:
+            app.after_request(self._add_header)
+
+        if self.sink is not None:
+            app.teardown_request(self._publish)
+
+    def _add_header(self, response):
+        timings = get_timings()
+
+        if timings:
+            response.headers['Server-Timing'] = ', '.join('{};dur={:.2f}'.format(name, duration * 1000)
+                                                          for name, duration in timings.items())
+
+        return response
+
+    def _publish(self, exception=None):
+        timings = get_timings()
+
+        if not timings:
+            return
+
+        try:
+            self.sink.record(request.endpoint, timings)
+        except Exception:
+            # metrics must never break a request
+            logger.exception('Failed to publish auth timings')